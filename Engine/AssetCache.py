@@ -0,0 +1,104 @@
+import os
+import struct
+import wave
+import zlib
+import pygame
+from Engine.DebugLog import Debug
+
+# Decoded images / sounds kept on disk, a warm start reads raw pixels / PCM instead of decoding PNG / WAV files
+# An entry is only used while its source has the same mtime and size, and its payload matches its checksum
+class AssetCache:
+    MAGIC = b"WBAC"
+    VERSION = 1
+    # magic, version, kind, source mtime_ns, source size, crc32 of the payload, then 3 kind specific values
+    HEADER = struct.Struct("<4sHBqqIiii")
+    IMAGE = 0 # width, height, 0 / payload: RGBA pixels
+    SOUND = 1 # mixer frequency, format, channels / payload: raw samples as the mixer plays them
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0 # sounds loaded from their source as is
+
+    def GetEntryPath(self, path):
+        return os.path.join(self.cacheDir, os.path.normpath(path).replace(os.sep, "_").replace(":", "_") + ".raw")
+
+    # Surface in the file's pixel format, convert_alpha() it on the main thread
+    def LoadImage(self, path) -> pygame.Surface:
+        stat = os.stat(path)
+        entry = self.__read(path, stat, AssetCache.IMAGE)
+        if entry != None:
+            (width, height, unused), payload = entry
+            if len(payload) == width * height * 4:
+                self.hits += 1
+                # Shares the payload's memory, convert_alpha() makes the copy
+                return pygame.image.frombuffer(payload, (width, height), "RGBA")
+        self.misses += 1
+        surface = pygame.image.load(path)
+        width, height = surface.get_size()
+        self.__write(path, stat, AssetCache.IMAGE, (width, height, 0), pygame.image.tobytes(surface, "RGBA"))
+        return surface
+
+    # Needs pygame.mixer initialized, samples are cached in its current format
+    def LoadSound(self, path) -> pygame.mixer.Sound:
+        mixer = pygame.mixer.get_init()
+        if AssetCache.__isMixerFormat(path, mixer):
+            # Loading it is a plain copy of its samples, an entry would only be read and checked on top
+            self.skipped += 1
+            return pygame.mixer.Sound(path)
+        stat = os.stat(path)
+        entry = self.__read(path, stat, AssetCache.SOUND)
+        if entry != None and entry[0] == mixer:
+            self.hits += 1
+            return pygame.mixer.Sound(buffer=entry[1])
+        self.misses += 1
+        sound = pygame.mixer.Sound(path)
+        self.__write(path, stat, AssetCache.SOUND, mixer, sound.get_raw())
+        return sound
+
+    # PCM WAV with the mixer's frequency, sample format and channels
+    @staticmethod
+    def __isMixerFormat(path, mixer):
+        try:
+            with wave.open(path, "rb") as f:
+                return ((f.getframerate(), {1 : 8, 2 : -16}.get(f.getsampwidth()), f.getnchannels()) == mixer)
+        except (wave.Error, EOFError, OSError):
+            return False
+
+    # Returns (kind specific values, payload) or None when there is no valid entry
+    def __read(self, path, stat, kind):
+        try:
+            with open(self.GetEntryPath(path), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        Header = AssetCache.HEADER
+        if len(data) < Header.size:
+            return None
+        magic, version, entryKind, mtime, size, checksum, a, b, c = Header.unpack_from(data)
+        if (magic != AssetCache.MAGIC or version != AssetCache.VERSION or entryKind != kind or
+            mtime != stat.st_mtime_ns or size != stat.st_size):
+            return None
+        payload = memoryview(data)[Header.size:]
+        if zlib.crc32(payload) != checksum:
+            Debug.Warn(f'Cached {path} is corrupt, decoding the source instead')
+            return None
+        return (a, b, c), payload
+
+    def __write(self, path, stat, kind, values, payload):
+        entryPath = self.GetEntryPath(path)
+        header = AssetCache.HEADER.pack(AssetCache.MAGIC, AssetCache.VERSION, kind, stat.st_mtime_ns, stat.st_size,
+                                        zlib.crc32(payload), *values)
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            # Written under another name and swapped in, a half written entry is never picked up
+            with open(entryPath + ".tmp", "wb") as f:
+                f.write(header)
+                f.write(payload)
+            os.replace(entryPath + ".tmp", entryPath)
+        except OSError as e:
+            Debug.Warn(f'Could not write cached {path} : {e}')
+
+    def GetStats(self):
+        return {"hits" : self.hits, "misses" : self.misses, "skipped" : self.skipped}
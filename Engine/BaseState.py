@@ -1,40 +1,30 @@
 from pygame import rect
 from Engine.DebugLog import Debug
+from Engine.Profiler import Profiler
 from Engine.ResourceManager import ResourceManager
 from Engine.StateManager import StateManager
 from Engine.Utilities import MYCOLOR
 from Engine.Vector2 import Vector2
 import pygame
 
-class Entity:
-    def __init__(self):
-        self.type = "" # "Sprite", "Font"
-        self.name = ""
-        self.color = MYCOLOR.WHITE
-        self.position = Vector2.Zero()
-        self.rotation : int = 0
-        self.scale = Vector2.One()
-        self.size = 0
-
-    @classmethod
-    def SetAsSprite(cls, texName, pos : Vector2, rot : int, scale : Vector2):
-        obj = cls()
-        obj.type = "Sprite"
-        obj.name = texName
-        obj.position = pos
-        obj.rotation = rot
-        obj.scale = scale
-        return obj
-
-    @classmethod
-    def SetAsFont(cls, text : str, pos : Vector2, col, size : int):
-        obj = cls()
-        obj.type = "Font"
-        obj.name = text
-        obj.position = pos
-        obj.color = col
-        obj.size = size
-        return obj
+# Render command opcodes, a command is a flat tuple (opcode, ...)
+class RenderOp:
+    SPRITE = 0  # (SPRITE, texName, position, scale)
+    FONT = 1    # (FONT, text, position, color, size)
+    SURFACE = 2 # (SURFACE, surface, position, key)
+    TILE = 3    # (TILE, atlasId, position)
+
+    @staticmethod
+    def Signature(cmd):
+        # Hashable description of what a command puts on screen, used for dirty rect tracking
+        op, pos = cmd[0], cmd[2]
+        if op == RenderOp.SPRITE:
+            return (op, cmd[1], cmd[3].x, cmd[3].y, pos.x, pos.y)
+        elif op == RenderOp.FONT:
+            return (op, cmd[1], tuple(cmd[3]), cmd[4], pos.x, pos.y)
+        elif op == RenderOp.TILE:
+            return (op, cmd[1], pos.x, pos.y)
+        return (op, id(cmd[1]) if cmd[3] == None else cmd[3], pos.x, pos.y)
 
 
 class BaseState:
@@ -50,9 +40,20 @@ class BaseState:
         self.window = win
         self.name = name
         self.eventlist =[]
+        # Dirty rect presentation, only push the screen regions that changed since last frame
+        self.dirtyRectMode = False
+        self.prevFrameRects = None # Command signature -> screen rect of the last presented frame
+        self.presentStats = {"frames" : 0, "fullFrames" : 0, "skippedFrames" : 0, "pixels" : 0}
+        # Static frame, the last presented frame stays on screen until an event or the content changes
+        self.staticFrame = False
+        self.frameInvalid = True
+        self.lastContentKey = None
+        self.keyState = None # Scripted key state used instead of pygame.key.get_pressed(), e.g. by benchmark.py
 
     def Load(self):
         Debug.Log(f'Loading... {self.name}')
+        self.prevFrameRects = None # Screen holds another state's frame
+        self.Invalidate()
         
     def Unload(self):
         Debug.Log(f'Unloading... {self.name}')
@@ -60,17 +61,41 @@ class BaseState:
     def Update(self, dt):
         pass
 
+    def GetPressedKeys(self):
+        return pygame.key.get_pressed() if self.keyState == None else self.keyState
+
+    def Invalidate(self):
+        self.frameInvalid = True
+
+    # contentKey: anything that changes what the state draws besides events, e.g. (page, selection)
+    def NeedsRedraw(self, contentKey = None):
+        if not self.staticFrame:
+            return True
+        if self.eventlist or contentKey != self.lastContentKey:
+            self.frameInvalid = True
+        self.lastContentKey = contentKey
+        return self.frameInvalid
+
+    def IsIdle(self):
+        return self.staticFrame and not self.frameInvalid
+
     def AddDrawSprite(self, texName : str, position : Vector2 = Vector2(), rotation : float = 0, scale : Vector2 = Vector2.One()):
-        self.renderList.append(Entity.SetAsSprite(texName, position, rotation, scale))
+        self.renderList.append((RenderOp.SPRITE, texName, position, scale))
 
     def AddDrawFont(self, text : str, pos : Vector2 = Vector2(), col : tuple = (255,255,255), size : int = 24):
-        self.renderList.append(Entity.SetAsFont(text, pos, col, size))
+        self.renderList.append((RenderOp.FONT, text, pos, col, size))
+
+    def AddDrawTile(self, atlasId : int, position : Vector2 = Vector2()):
+        self.renderList.append((RenderOp.TILE, atlasId, position))
+
+    def AddDrawSurface(self, surface : pygame.Surface, position : Vector2 = Vector2(), key = None):
+        self.renderList.append((RenderOp.SURFACE, surface, position, key))
 
     def AddDrawUISprite(self, texName : str, position : Vector2 = Vector2(), rotation : float = 0, scale : Vector2 = Vector2.One()):
-        self.UIrenderList.append(Entity.SetAsSprite(texName, position, rotation, scale))
+        self.UIrenderList.append((RenderOp.SPRITE, texName, position, scale))
 
     def AddDrawUIFont(self, text : str, pos : Vector2 = Vector2(), col : tuple = (255,255,255), size : int = 24):
-        self.UIrenderList.append(Entity.SetAsFont(text, pos, col, size))
+        self.UIrenderList.append((RenderOp.FONT, text, pos, col, size))
 
     def AddDrawDebugLineCall(self, start, end, color):
         self.debuglines.append((start, end, color))
@@ -85,33 +110,14 @@ class BaseState:
         self.debugcircles.append((point, 2, color))
 
     def Draw(self):
+        t = Profiler.Start()
         # Background
         self.window.fill(self.backgroundColor)
+        frameRects = {} if self.dirtyRectMode else None
         # Draw all Sprite & Font
-        for entity in self.renderList:
-            if entity.type == "Sprite":
-                texture = self.rm.GetTexture(entity.name)
-                if texture != None:
-                    self.window.blit(pygame.transform.scale(texture.tex, texture.GetNewSizeAfterScale(entity.scale).toTuple()),
-                                    entity.position.toTuple())
-                else:
-                    Debug.Error(f'{entity.name} is not loaded...')
-            elif entity.type == "Font":
-                img = self.rm.RenderFont(entity.name, entity.color, entity.size)
-                self.window.blit(img, entity.position.toTuple())
-
+        self.__drawLayer(self.renderList, frameRects)
         # Draw UI Sprite & Font
-        for entity in self.UIrenderList:
-            if entity.type == "Sprite":
-                texture = self.rm.GetTexture(entity.name)
-                if texture != None:
-                    self.window.blit(pygame.transform.scale(texture.tex, texture.GetNewSizeAfterScale(entity.scale).toTuple()),
-                                    entity.position.toTuple())
-                else:
-                    Debug.Error(f'{entity.name} is not loaded...')
-            elif entity.type == "Font":
-                img = self.rm.RenderFont(entity.name, entity.color, entity.size)
-                self.window.blit(img, entity.position.toTuple())
+        self.__drawLayer(self.UIrenderList, frameRects)
 
         # Draw all debug
         LINE_WIDTH = 2
@@ -122,13 +128,102 @@ class BaseState:
         for cir in self.debugcircles:
             pygame.draw.circle(self.window, cir[2], cir[0].toTuple(), cir[1], LINE_WIDTH)
             
+        Profiler.Stop("compose", t)
+
         # Refresh
-        pygame.display.update()
+        t = Profiler.Start()
+        hasDebug = self.debuglines or self.debugrects or self.debugcircles
+        if frameRects == None or hasDebug:
+            self.__present(None)
+            self.prevFrameRects = None
+        else:
+            self.__present(self.__collectDirtyRects(frameRects))
+            self.prevFrameRects = frameRects
+        Profiler.Stop("present", t)
+        self.frameInvalid = False
         self.renderList.clear()
         self.UIrenderList.clear()
         self.debuglines.clear()
         self.debugrects.clear()
         self.debugcircles.clear()
         
+    def __resolveLayer(self, layer, resolved = None):
+        # Turn render commands into (surface, dest[, area]) items ready for Surface.blits()
+        blitList = []
+        rm = self.rm
+        atlas = rm.GetAtlas()
+        for cmd in layer:
+            op = cmd[0]
+            pos = cmd[2]
+            if op == RenderOp.TILE:
+                rect = atlas.rects[cmd[1]]
+                if rect != None:
+                    blitList.append((atlas.surface, (pos.x, pos.y), rect))
+                    if resolved != None:
+                        resolved.append(cmd)
+                    continue
+                # Not packed, fall back to the texture's own surface
+                op, cmd = RenderOp.SPRITE, (RenderOp.SPRITE, atlas.names[cmd[1]], pos, Vector2.One())
+            if op == RenderOp.SPRITE:
+                scale = cmd[3]
+                rect = atlas.GetRectByName(cmd[1]) if scale.x == 1 and scale.y == 1 else None
+                if rect != None:
+                    blitList.append((atlas.surface, (pos.x, pos.y), rect))
+                    if resolved != None:
+                        resolved.append(cmd)
+                    continue
+                surface = rm.GetScaledTexture(cmd[1], scale)
+                if surface == None:
+                    Debug.Error(f'{cmd[1]} is not loaded...')
+                    continue
+            elif op == RenderOp.FONT:
+                surface = rm.RenderFont(cmd[1], cmd[3], cmd[4])
+            else:
+                surface = cmd[1]
+            blitList.append((surface, (pos.x, pos.y)))
+            if resolved != None:
+                resolved.append(cmd)
+        return blitList
+
+    def __drawLayer(self, layer, frameRects):
+        if frameRects == None:
+            self.window.blits(self.__resolveLayer(layer), False)
+            return
+        resolved = []
+        rects = self.window.blits(self.__resolveLayer(layer, resolved))
+        for cmd, rect in zip(resolved, rects):
+            frameRects[RenderOp.Signature(cmd)] = rect
+
+    def __collectDirtyRects(self, frameRects):
+        # First frame after enabling the mode, or after a full refresh
+        if self.prevFrameRects == None:
+            return None
+        dirty = [rect for sig, rect in frameRects.items() if sig not in self.prevFrameRects]
+        dirty += [rect for sig, rect in self.prevFrameRects.items() if sig not in frameRects]
+        return dirty
+
+    def __present(self, rects):
+        stats = self.presentStats
+        stats["frames"] += 1
+        if rects == None:
+            pygame.display.update()
+            stats["fullFrames"] += 1
+            stats["pixels"] += self.window.get_width() * self.window.get_height()
+            return
+        screen = self.window.get_rect()
+        rects = [rect.clip(screen) for rect in rects]
+        rects = [rect for rect in rects if rect.width > 0 and rect.height > 0]
+        if not rects:
+            stats["skippedFrames"] += 1
+            return
+        pygame.display.update(rects)
+        stats["pixels"] += sum(rect.width * rect.height for rect in rects)
+
+    def GetPresentStats(self):
+        stats = dict(self.presentStats)
+        stats["pixelsPerFrame"] = stats["pixels"] / stats["frames"] if stats["frames"] > 0 else 0
+        return stats
+
     def LogInfo(self):
-        Debug.Log(f'Level name : {self.name}')
\ No newline at end of file
+        Debug.Log(f'Level name : {self.name}')
+        Debug.Log(f'Present stats : {self.GetPresentStats()}')
\ No newline at end of file
@@ -0,0 +1,113 @@
+import pygame
+from Engine.DebugLog import Debug
+from Engine.LevelMap import LevelMap
+from Engine.Vector2 import Vector2
+
+class TileChunk:
+    def __init__(self, cx, cy):
+        self.cx = cx
+        self.cy = cy
+        self.surface : pygame.Surface = None # None when the chunk holds no tiles
+        self.dirty = True
+        self.version = 0 # bumped on every bake
+
+class ChunkedTileLayer:
+    def __init__(self, rm, chunkSize = 8):
+        self.rm = rm
+        self.chunkSize = chunkSize # in tiles
+        self.levelMap : LevelMap = None
+        self.chunkDim = (0, 0)
+        self.chunks = []
+        self.bakeCount = 0
+        # Baked surfaces kept before off-screen ones are freed, only long (streamed) levels get past it
+        self.maxBakedChunks = 32
+        self.bakedChunks = set() # chunks indices holding a surface
+
+    def GetChunkPixelSize(self):
+        return self.chunkSize * self.levelMap.gridsize
+
+    # Set up the chunks of a level, call once after LevelMap.Load(). Chunks are baked the first time they are drawn
+    def Build(self, levelMap : LevelMap):
+        self.levelMap = levelMap
+        self.levelMap.dirtyTiles.clear()
+        self.chunkDim = (-(-levelMap.mapDim[0] // self.chunkSize), -(-levelMap.mapDim[1] // self.chunkSize))
+        self.chunks = [TileChunk(cx, cy) for cy in range(self.chunkDim[1]) for cx in range(self.chunkDim[0])]
+        self.bakedChunks.clear()
+
+    # Mark the chunks that hold tiles written since the last call, Draw() re-bakes them when visible
+    def Refresh(self):
+        dirtyTiles = self.levelMap.dirtyTiles
+        if not dirtyTiles:
+            return
+        width = self.levelMap.mapDim[0]
+        for index in dirtyTiles:
+            cx = (index % width) // self.chunkSize
+            cy = (index // width) // self.chunkSize
+            self.chunks[cy * self.chunkDim[0] + cx].dirty = True
+        dirtyTiles.clear()
+
+    def __bake(self, chunk : TileChunk):
+        chunk.dirty = False
+        chunk.version += 1
+        Tiles = LevelMap.Tiles
+        gridsize = self.levelMap.gridsize
+        width, height = self.levelMap.mapDim
+        map = self.levelMap.map
+        x0, y0 = chunk.cx * self.chunkSize, chunk.cy * self.chunkSize
+        x1, y1 = min(x0 + self.chunkSize, width), min(y0 + self.chunkSize, height)
+        surface = chunk.surface
+        if surface == None:
+            pixelSize = self.GetChunkPixelSize()
+            surface = pygame.Surface((pixelSize, pixelSize), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 0))
+        atlas = self.rm.GetAtlas()
+        blitList = []
+        for y in range(y0, y1):
+            row = y * width
+            for x in range(x0, x1):
+                value = map[row + x]
+                if value != 0:
+                    dest = ((x - x0) * gridsize, (y - y0) * gridsize)
+                    # Tile values are atlas ids
+                    rect = atlas.GetRect(value)
+                    if rect != None:
+                        blitList.append((atlas.surface, dest, rect))
+                        continue
+                    texture = self.rm.GetTexture(Tiles[value])
+                    if texture != None:
+                        blitList.append((texture.tex, dest))
+                    else:
+                        Debug.Error(f'{Tiles[value]} is not loaded...')
+        surface.blits(blitList, False)
+        chunk.surface = surface if blitList else None
+        if chunk.surface != None:
+            self.bakedChunks.add(chunk.cy * self.chunkDim[0] + chunk.cx)
+        else:
+            self.bakedChunks.discard(chunk.cy * self.chunkDim[0] + chunk.cx)
+        self.bakeCount += 1
+
+    # Queue the chunks in chunkRange (x0, y0, x1, y1), end exclusive, through state.AddDrawSurface()
+    def Draw(self, state, cameraPos : Vector2, chunkRange):
+        pixelSize = self.GetChunkPixelSize()
+        cx0, cy0, cx1, cy1 = chunkRange
+        for cy in range(cy0, cy1):
+            row = cy * self.chunkDim[0]
+            for cx in range(cx0, cx1):
+                chunk = self.chunks[row + cx]
+                if chunk.dirty:
+                    self.__bake(chunk)
+                if chunk.surface != None:
+                    state.AddDrawSurface(chunk.surface, Vector2(cx * pixelSize - cameraPos.x, cy * pixelSize - cameraPos.y),
+                                         (cx, cy, chunk.version))
+        if len(self.bakedChunks) > self.maxBakedChunks:
+            self.__freeOffscreen(chunkRange)
+
+    # Drop the surfaces more than a chunk outside chunkRange, they are baked again when they come back into view
+    def __freeOffscreen(self, chunkRange):
+        cx0, cy0, cx1, cy1 = chunkRange
+        for index in list(self.bakedChunks):
+            chunk = self.chunks[index]
+            if not (cx0 - 1 <= chunk.cx <= cx1 and cy0 - 1 <= chunk.cy <= cy1):
+                chunk.surface = None
+                chunk.dirty = True
+                self.bakedChunks.discard(index)
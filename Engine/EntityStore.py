@@ -0,0 +1,102 @@
+from array import array
+from Engine.Utilities import np
+from Engine.Vector2 import Vector2
+
+# Moving bodies as struct-of-arrays, one contiguous column per field, an entity is a row index
+# Physics runs over every row at once through numpy views of the columns, or a plain loop without numpy
+class EntityStore:
+    ACTIVE = 1 # flag, inactive rows are kept but not simulated
+    VECTORIZE_MIN = 48 # below this many rows the plain loop beats numpy's per call overhead (benchmark.py entities)
+
+    def __init__(self):
+        self.posX = array('d')
+        self.posY = array('d')
+        self.velX = array('d')
+        self.velY = array('d')
+        self.radius = array('d')
+        self.flags = array('B')
+        self.gravity = 9.8
+        self.friction = 12.0 # horizontal speed lost per second
+        self.terminalVelocity = 33.0
+        self.frictionDeadzone = 0.3 # below this horizontal speed the body stops
+
+    def __len__(self):
+        return len(self.posX)
+
+    def Add(self, position : Vector2, velocity : Vector2 = None, radius = 0.0, flags = ACTIVE):
+        self.posX.append(position.x)
+        self.posY.append(position.y)
+        self.velX.append(0.0 if velocity == None else velocity.x)
+        self.velY.append(0.0 if velocity == None else velocity.y)
+        self.radius.append(radius)
+        self.flags.append(flags)
+        return len(self.posX) - 1
+
+    # Swap-remove, the last row takes the removed index. Returns the index that moved or -1
+    def Remove(self, index):
+        last = len(self.posX) - 1
+        for column in (self.posX, self.posY, self.velX, self.velY, self.radius, self.flags):
+            column[index] = column[last]
+            column.pop()
+        return last if index != last else -1
+
+    def Clear(self):
+        for column in (self.posX, self.posY, self.velX, self.velY, self.radius, self.flags):
+            del column[:]
+
+    def SetState(self, index, position : Vector2, velocity : Vector2):
+        self.posX[index], self.posY[index] = position.x, position.y
+        self.velX[index], self.velY[index] = velocity.x, velocity.y
+
+    def GetState(self, index, position : Vector2, velocity : Vector2):
+        position.Set(self.posX[index], self.posY[index])
+        velocity.Set(self.velX[index], self.velY[index])
+
+    # Gravity, terminal velocity, friction and integration for every active row, one step of dt seconds
+    def Integrate(self, dt):
+        if np != None and len(self.posX) >= EntityStore.VECTORIZE_MIN:
+            self.__integrateVectorized(dt)
+        else:
+            self.__integrateLoop(dt)
+
+    def __integrateLoop(self, dt):
+        posX, posY, velX, velY, flags = self.posX, self.posY, self.velX, self.velY, self.flags
+        gravityStep = self.gravity * dt * 2
+        frictionStep = self.friction * dt
+        terminal = self.terminalVelocity
+        deadzone = self.frictionDeadzone
+        moveScale = 64.0 * dt
+        for i in range(len(posX)):
+            if not flags[i] & EntityStore.ACTIVE:
+                continue
+            vy = velY[i] + gravityStep
+            if vy > terminal:
+                vy = terminal
+            vx = velX[i]
+            if vx > deadzone:
+                vx -= frictionStep
+            elif vx < -deadzone:
+                vx += frictionStep
+            else:
+                vx = 0.0
+            velX[i], velY[i] = vx, vy
+            posX[i] += vx * moveScale
+            posY[i] += vy * moveScale
+
+    def __integrateVectorized(self, dt):
+        # Views share memory with the columns, writes land in the arrays directly
+        posX = np.frombuffer(self.posX, dtype=np.float64)
+        posY = np.frombuffer(self.posY, dtype=np.float64)
+        velX = np.frombuffer(self.velX, dtype=np.float64)
+        velY = np.frombuffer(self.velY, dtype=np.float64)
+        active = (np.frombuffer(self.flags, dtype=np.uint8) & EntityStore.ACTIVE) != 0
+        frictionStep = self.friction * dt
+        moveScale = 64.0 * dt
+
+        vy = np.minimum(velY + self.gravity * dt * 2, self.terminalVelocity)
+        vx = np.where(velX > self.frictionDeadzone, velX - frictionStep,
+                      np.where(velX < -self.frictionDeadzone, velX + frictionStep, 0.0))
+        velX[:] = np.where(active, vx, velX)
+        velY[:] = np.where(active, vy, velY)
+        posX += np.where(active, velX * moveScale, 0.0)
+        posY += np.where(active, velY * moveScale, 0.0)
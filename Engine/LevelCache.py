@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from Engine.DebugLog import Debug
+from Engine.LevelMap import LevelMap
+from Engine.StreamedLevelMap import StreamedLevelMap
+
+# Ready to use LevelMaps, either loaded ahead of time on a worker thread or kept resident after first use
+class LevelCache:
+    RESIDENT_CAPACITY = 4 # Max number of shared maps kept loaded
+
+    def __init__(self, gridsize):
+        self.gridsize = gridsize
+        self.resident = OrderedDict() # path -> LevelMap shared by every Get(), oldest first
+        self.pending = {} # path -> Future of a LevelMap handed out once by Take()
+        self.taken = {} # path -> LevelMap handed out by Take() and not invalidated since
+        self.released = OrderedDict() # path -> LevelMap given back by Release(), oldest first
+        self.executor : ThreadPoolExecutor = None # Started by the first Prefetch()
+        self.hits = 0
+        self.misses = 0
+
+    def __load(self, path):
+        levelMap = StreamedLevelMap(self.gridsize) if StreamedLevelMap.ShouldStream(path) else LevelMap(self.gridsize)
+        levelMap.Load(path)
+        return levelMap
+
+    # Start loading a level on the worker thread, Take() hands it over later
+    def Prefetch(self, path):
+        if path in self.pending or path in self.released:
+            return
+        if self.executor == None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LevelCache")
+        self.pending[path] = self.executor.submit(self.__load, path)
+
+    # A LevelMap of the caller's own to play and modify, the prefetched one when there is one
+    def Take(self, path) -> LevelMap:
+        # Played before, restarting it only copies its snapshot back
+        levelMap = self.released.pop(path, None)
+        if levelMap != None:
+            levelMap.Reset()
+            self.hits += 1
+            self.taken[path] = levelMap
+            return levelMap
+        future = self.pending.pop(path, None)
+        if future != None:
+            try:
+                levelMap = future.result() # Waits when the worker isn't done yet
+                self.hits += 1
+                self.taken[path] = levelMap
+                return levelMap
+            except (OSError, ValueError, IndexError) as e:
+                Debug.Warn(f'Prefetching {path} failed : {e}')
+        self.misses += 1
+        levelMap = self.taken[path] = self.__load(path)
+        return levelMap
+
+    # Hand a map from Take() back once it isn't played anymore, dropped when it was invalidated meanwhile
+    def Release(self, path, levelMap : LevelMap):
+        if self.taken.get(path) is not levelMap:
+            return
+        del self.taken[path]
+        self.released[path] = levelMap
+        self.released.move_to_end(path)
+        if len(self.released) > LevelCache.RESIDENT_CAPACITY:
+            self.released.popitem(last=False)
+
+    # Shared LevelMap for screens that only draw it, stays loaded until evicted or invalidated
+    def Get(self, path) -> LevelMap:
+        levelMap = self.resident.get(path)
+        if levelMap != None:
+            self.resident.move_to_end(path)
+            self.hits += 1
+            return levelMap
+        self.misses += 1
+        levelMap = self.resident[path] = self.__load(path)
+        if len(self.resident) > LevelCache.RESIDENT_CAPACITY:
+            self.resident.popitem(last=False)
+        return levelMap
+
+    # Forget a level (every level when path is None), e.g. after its .dat changed
+    def Invalidate(self, path = None):
+        paths = list(self.pending) if path == None else [path]
+        for p in paths:
+            future = self.pending.pop(p, None)
+            if future != None:
+                future.cancel() # A load already running finishes but its result is dropped
+        if path == None:
+            self.resident.clear()
+            self.taken.clear()
+            self.released.clear()
+        else:
+            self.resident.pop(path, None)
+            self.taken.pop(path, None)
+            self.released.pop(path, None)
+
+    def GetStats(self):
+        return {"hits" : self.hits, "misses" : self.misses, "resident" : len(self.resident), "released" : len(self.released), "pending" : len(self.pending)}
+
+    def Shutdown(self):
+        self.Invalidate()
+        if self.executor != None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -1,10 +1,20 @@
+import os
+import struct
+from array import array
+import zlib
+from Engine.DebugLog import Debug
+from Engine.SpatialGrid import SpatialGrid
 from Engine.Vector2 import Vector2
+from Engine.Utilities import np
 
 class Box:
-    def __init__(self, name, pos = None, size = None, active = True):
+    def __init__(self, name, pos = None, size = None, active = True, kind = -1, index = -1):
         self.name = name
+        self.kind = kind # tile value, LevelMap.TilesToIndexMap[name]
+        self.index = index # LevelMap.map index of the top left tile
         self.position = Vector2() if pos == None else pos
         self.size = Vector2() if size == None else size
+        self.bottomright = self.position + self.size
         self.active = active
 
 class LevelMap:
@@ -13,17 +23,38 @@ class LevelMap:
     TilesToIndexMap = {"-" : 0, "Brick" : 1, "Slope" : 2, "Ring" : 3, 
                         "Spike" : 4, "JumpPad" : 5, "Startpoint" : 6, "Endpoint" : 7,
                         "Checkpoint_Active" : 8, "Checkpoint_NotActive" : 9, "NotEnd" : 10, "JumpBoost" : 11, "SpeedBoost" : 12}
+
+    # Compiled level file: header, tile grid as one byte per tile, then collider, trigger and reset point tables
+    # Header: magic, version, gridsize, width, height, start x/y, end x/y, table sizes, crc32 of the rest
+    compiledDir = None # folder for compiled levels, None to always parse the .dat
+    COMPILED_MAGIC = b"WBLV"
+    COMPILED_VERSION = 3
+    COMPILED_HEADER = struct.Struct("<4sHHHHiiiiIII")
+    COMPILED_BOX = struct.Struct("<Bidddd") # kind, tile index, x, y, w, h
             
     def __init__(self, gridsize):
         self.gridsize = gridsize
         self.mapDim = ()
         self.colliders = []
         self.triggers = []
-        self.map = []
+        # Broad phase over colliders / triggers, trigger active flags are read live so Reset() keeps them valid
+        self.colliderGrid = SpatialGrid(gridsize * 2)
+        self.triggerGrid = SpatialGrid(gridsize * 2)
+        # Same boxes as (N, 4) left, top, right, bottom arrays for Utilities.CircleAABBBatch, None without numpy
+        self.colliderArray = None
+        self.triggerArray = None
+        self.map = array('B') # tile values, row-major
+        self.tileIndex = {} # tile value -> set of map indices holding it, kept up to date by SetTile()
         self.startpoint = Vector2()
         self.endpoint = Vector2()
         self.spawnpoint = Vector2()
-        self.resetPoints = []
+        self.colliderStats = {"wallTiles" : 0, "colliders" : 0}
+        self.dirtyTiles = [] # map indices written since the renderer last looked
+        # State right after generation, Reset() copies back only what was written since (copy-on-write)
+        self.snapshotTiles : array = None
+        self.snapshotTriggers : bytearray = None # trigger active flags
+        self.snapshotEndpoint = Vector2()
+        self.changedTiles : set = None # map indices written since the snapshot
 
     def GetStartPoint_ScreenPos(self):
         return self.startpoint * self.gridsize
@@ -31,10 +62,96 @@ class LevelMap:
     def GetRespawnPoint_ScreenPos(self):
         return self.spawnpoint * self.gridsize
 
+    # Make the tiles, colliders and triggers within extent of center resident. The whole map always is,
+    # StreamedLevelMap overrides this. Returns True when the colliders / triggers changed
+    def StreamAround(self, center : Vector2, extent : Vector2):
+        return False
+
+    # LoadMap() + GenerateColliders(), through the compiled file when it is newer than the .dat
+    def Load(self, path):
+        compiledPath = LevelMap.GetCompiledPath(path)
+        if compiledPath != None and LevelMap.__isNewer(compiledPath, path) and self.__loadCompiled(compiledPath):
+            return
+        self.LoadMap(path)
+        self.GenerateColliders()
+        if compiledPath != None:
+            self.__saveCompiled(compiledPath)
+
+    @staticmethod
+    def GetCompiledPath(path):
+        if LevelMap.compiledDir == None:
+            return None
+        return os.path.join(LevelMap.compiledDir, os.path.splitext(os.path.basename(path))[0] + ".lvl")
+
+    @staticmethod
+    def __isNewer(path, source):
+        try:
+            return os.stat(path).st_mtime_ns > os.stat(source).st_mtime_ns
+        except OSError:
+            return False
+
+    def __saveCompiled(self, path):
+        body = bytearray(self.map.tobytes())
+        for box in self.colliders + self.triggers:
+            body += LevelMap.COMPILED_BOX.pack(box.kind, box.index, box.position.x, box.position.y, box.size.x, box.size.y)
+        header = LevelMap.COMPILED_HEADER.pack(LevelMap.COMPILED_MAGIC, LevelMap.COMPILED_VERSION, self.gridsize,
+                                               self.mapDim[0], self.mapDim[1], int(self.startpoint.x), int(self.startpoint.y),
+                                               int(self.endpoint.x), int(self.endpoint.y),
+                                               len(self.colliders), len(self.triggers), zlib.crc32(body))
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # Written under another name and swapped in, a half written file is never picked up
+            with open(path + ".tmp", "wb") as f:
+                f.write(header)
+                f.write(body)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            Debug.Warn(f'Could not write compiled level {path} : {e}')
+
+    # Returns False when the file is missing, from another version / gridsize or corrupt
+    def __loadCompiled(self, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        Header, BoxStruct = LevelMap.COMPILED_HEADER, LevelMap.COMPILED_BOX
+        if len(data) < Header.size:
+            return False
+        (magic, version, gridsize, width, height, startX, startY, endX, endY,
+         colliderCount, triggerCount, checksum) = Header.unpack_from(data)
+        tileEnd = Header.size + width * height
+        boxEnd = tileEnd + (colliderCount + triggerCount) * BoxStruct.size
+        if (magic != LevelMap.COMPILED_MAGIC or version != LevelMap.COMPILED_VERSION or gridsize != self.gridsize or
+            len(data) != boxEnd):
+            return False
+        body = memoryview(data)[Header.size:]
+        if zlib.crc32(body) != checksum:
+            Debug.Warn(f'{path} is corrupt, parsing the source level instead')
+            return False
+
+        self.map = array('B', data[Header.size:tileEnd])
+        self.IndexTiles()
+        self.dirtyTiles.clear()
+        self.mapDim = (width, height)
+        self.startpoint = Vector2(startX, startY)
+        self.spawnpoint = self.startpoint
+        self.endpoint = Vector2(endX, endY)
+        boxes = [Box(LevelMap.Tiles[kind], Vector2(x, y), Vector2(w, h), kind=kind, index=index)
+                 for kind, index, x, y, w, h in BoxStruct.iter_unpack(body[tileEnd - Header.size:])]
+        self.colliders[:] = boxes[:colliderCount]
+        self.triggers[:] = boxes[colliderCount:]
+        wallTiles = int(sum(box.size.x * box.size.y for box in self.colliders) / (gridsize * gridsize))
+        self.colliderStats = {"wallTiles" : wallTiles, "colliders" : len(self.colliders)}
+        self.BuildQueries()
+        self.TakeSnapshot()
+        return True
+
     def LoadMap(self, path):
         with open(path, "r") as f:
             x, y = 0, 0
-            self.map.clear()
+            self.map = array('B')
+            self.dirtyTiles.clear()
             for line in f:
                 list = line.split(',')
                 x = 0
@@ -49,108 +166,171 @@ class LevelMap:
                     x += 1
                 y += 1
             self.mapDim = (x,y)
+        self.IndexTiles()
+
+    def IndexTiles(self):
+        self.tileIndex = {}
+        for index, value in enumerate(self.map):
+            if value != 0:
+                indices = self.tileIndex.get(value)
+                if indices == None:
+                    indices = self.tileIndex[value] = set()
+                indices.add(index)
+
+    # Map indices holding a tile value, treat as read only
+    def FindTiles(self, value):
+        return self.tileIndex.get(value, ())
     
     def GenerateColliders(self):
         # Reset existing colliders
         self.colliders.clear()
         self.triggers.clear()
         # Find colliders
-        mymap = self.map.copy()
-        dimension = self.mapDim
-        for y in range(dimension[1]):
-            for x in range(dimension[0]):
-                value =  mymap[y * dimension[0] + x]
+        wallTiles = self.GenerateRegion(self.map[:], self.mapDim[0], self.mapDim[1], 0, 0,
+                                        self.colliders, self.triggers)
+        self.colliderStats = {"wallTiles" : wallTiles, "colliders" : len(self.colliders)}
+        Debug.Log(f'Merged {wallTiles} wall tiles into {len(self.colliders)} colliders')
+        self.BuildQueries()
+        self.TakeSnapshot()
+
+    def TakeSnapshot(self):
+        self.snapshotTiles = self.map[:]
+        self.snapshotTriggers = bytearray(trig.active for trig in self.triggers)
+        self.snapshotEndpoint = self.endpoint
+        self.changedTiles = set()
+
+    # Colliders / triggers of a width x height block of tiles whose top left tile is (originX, originY)
+    # tiles is a scratch copy, merged tiles are cleared from it. Returns the wall tile count
+    def GenerateRegion(self, tiles, width, height, originX, originY, colliders, triggers):
+        gridsize = self.gridsize
+        mapWidth = self.mapDim[0]
+        wallTiles = 0
+        for y in range(height):
+            for x in range(width):
+                value = tiles[y * width + x]
                 if value == 0: # Nothing
                     continue
+                tilePos = Vector2(originX + x, originY + y)
+                index = int(tilePos.y) * mapWidth + int(tilePos.x)
                 if value == 1: # Wall
-                    combinedSize = Vector2(1,1) # using normalized coord
-                    # Combine horizontal colliders
-                    if x < dimension[0]:
-                        for i in range(x+1, dimension[0]):
-                            if mymap[y * dimension[0] + (i)] == value:
-                                mymap[y * dimension[0] + (i)] = 0
-                                combinedSize.x += 1
-                            else:
-                                break
-                    # If no horizontal then check vertical and combine
-                    if y < dimension[1] and combinedSize.x == 1:
-                        for i in range(y+1, dimension[1]):
-                            if mymap[(i) * dimension[0] + x] == value:
-                                mymap[(i) * dimension[0] + x] = 0
-                                combinedSize.y += 1
-                            else:
-                                break
-                    self.colliders.append(Box(LevelMap.Tiles[value], 
-                                                Vector2(x,y) * self.gridsize, 
-                                                combinedSize * self.gridsize))
-                elif value == 3: # Ring
-                    self.triggers.append(Box(LevelMap.Tiles[value], 
-                                                Vector2(x,y) * self.gridsize + Vector2(self.gridsize/4,0), 
-                                                Vector2(self.gridsize/2, self.gridsize)))
-                    self.resetPoints.append((y * dimension[0] + x, value))
-                elif value == 11: # JumpBoost
-                    self.triggers.append(Box(LevelMap.Tiles[value], 
-                                                Vector2(x,y) * self.gridsize + Vector2(self.gridsize/4,0), 
-                                                Vector2(self.gridsize/2, self.gridsize)))
-                    self.resetPoints.append((y * dimension[0] + x, value))
-                elif value == 12: # SpeedBoost
-                    self.triggers.append(Box(LevelMap.Tiles[value], 
-                                                Vector2(x,y) * self.gridsize + Vector2(self.gridsize/4,0), 
-                                                Vector2(self.gridsize/2, self.gridsize)))
-                    self.resetPoints.append((y * dimension[0] + x, value))
+                    combinedSize = LevelMap.__mergeRect(tiles, width, height, x, y, value) # using normalized coord
+                    colliders.append(Box(LevelMap.Tiles[value], 
+                                         tilePos * gridsize, 
+                                         combinedSize * gridsize, kind=value, index=index))
+                    wallTiles += int(combinedSize.x * combinedSize.y)
+                elif value == 3 or value == 11 or value == 12: # Ring / JumpBoost / SpeedBoost
+                    triggers.append(Box(LevelMap.Tiles[value], 
+                                        tilePos * gridsize + Vector2(gridsize/4,0), 
+                                        Vector2(gridsize/2, gridsize), kind=value, index=index))
                 elif value == 4: # Spike
                     horizontalCount = 1
                     # Combine horizontal colliders
-                    if x < dimension[0]:
-                        for i in range(x+1, dimension[0]):
-                            if mymap[y * dimension[0] + (i)] == value:
-                                mymap[y * dimension[0] + (i)] = 0
-                                horizontalCount += 1
-                            else:
-                                break
-                    self.triggers.append(Box(LevelMap.Tiles[value], 
-                                                Vector2(x,y) * self.gridsize + Vector2(0,self.gridsize/2), 
-                                                Vector2(self.gridsize * horizontalCount, self.gridsize/2)))
+                    for i in range(x+1, width):
+                        if tiles[y * width + i] == value:
+                            tiles[y * width + i] = 0
+                            horizontalCount += 1
+                        else:
+                            break
+                    triggers.append(Box(LevelMap.Tiles[value], 
+                                        tilePos * gridsize + Vector2(0,gridsize/2), 
+                                        Vector2(gridsize * horizontalCount, gridsize/2), kind=value, index=index))
                 elif value == 5: # JumpPad
-                    self.triggers.append(Box(LevelMap.Tiles[value], 
-                                                Vector2(x,y) * self.gridsize + Vector2(0,8), 
-                                                Vector2(self.gridsize, self.gridsize-8)))
+                    triggers.append(Box(LevelMap.Tiles[value], 
+                                        tilePos * gridsize + Vector2(0,8), 
+                                        Vector2(gridsize, gridsize-8), kind=value, index=index))
                 elif value == 6 or value == 7: # Startpoint / Endpoint
-                    self.triggers.append(Box(LevelMap.Tiles[value], 
-                                                Vector2(x,y) * self.gridsize, 
-                                                Vector2(self.gridsize, self.gridsize)))
+                    triggers.append(Box(LevelMap.Tiles[value], 
+                                        tilePos * gridsize, 
+                                        Vector2(gridsize, gridsize), kind=value, index=index))
                 elif value == 9: # Checkpoint_NotActive, ignore 6(Checkpoint_Active)
-                    self.triggers.append(Box(LevelMap.Tiles[value], 
-                                                Vector2(x,y) * self.gridsize, 
-                                                Vector2(self.gridsize, self.gridsize)))
-                    self.resetPoints.append((y * dimension[0] + x, value))
+                    triggers.append(Box(LevelMap.Tiles[value], 
+                                        tilePos * gridsize, 
+                                        Vector2(gridsize, gridsize), kind=value, index=index))
+        return wallTiles
+
+    # Spatial grids / arrays over the current colliders and triggers
+    def BuildQueries(self):
+        self.colliderGrid.Build(self.colliders)
+        self.triggerGrid.Build(self.triggers)
+        self.colliderArray = LevelMap.__toBoxArray(self.colliders)
+        self.triggerArray = LevelMap.__toBoxArray(self.triggers)
+
+    @staticmethod
+    def __toBoxArray(boxes):
+        if np == None:
+            return None
+        array = np.empty((len(boxes), 4), dtype=np.float64)
+        for i, box in enumerate(boxes):
+            array[i] = (box.position.x, box.position.y, box.bottomright.x, box.bottomright.y)
+        return array
     
+    # Grow the largest rectangle of unmerged 'value' tiles with (x, y) as its top left corner,
+    # trying both row-first and column-first, and clear it from tiles
+    @staticmethod
+    def __mergeRect(tiles, width, height, x, y, value):
+        # Row first, then take whole rows below
+        w1 = 1
+        while x + w1 < width and tiles[y * width + x + w1] == value:
+            w1 += 1
+        h1 = 1
+        while y + h1 < height and all(tiles[(y + h1) * width + i] == value for i in range(x, x + w1)):
+            h1 += 1
+        # Column first, then take whole columns to the right
+        h2 = 1
+        while y + h2 < height and tiles[(y + h2) * width + x] == value:
+            h2 += 1
+        w2 = 1
+        while x + w2 < width and all(tiles[j * width + x + w2] == value for j in range(y, y + h2)):
+            w2 += 1
+        w, h = (w1, h1) if w1 * h1 >= w2 * h2 else (w2, h2)
+        for j in range(y, y + h):
+            for i in range(x, x + w):
+                tiles[j * width + i] = 0
+        return Vector2(w, h)
+
+    def SetTile(self, index, value):
+        previous = self.map[index]
+        self.map[index] = value
+        self.dirtyTiles.append(index)
+        if self.changedTiles != None:
+            self.changedTiles.add(index)
+        if self.tileIndex != None and previous != value:
+            if previous != 0:
+                self.tileIndex[previous].discard(index)
+            if value != 0:
+                indices = self.tileIndex.get(value)
+                if indices == None:
+                    indices = self.tileIndex[value] = set()
+                indices.add(index)
+
+    # Back to the snapshot, rings / checkpoints / endpoints included, without loading the level again
     def Reset(self):
-        # Reset coins
-        # Reset checkpoints
-        for point in self.resetPoints:
-            self.map[point[0]] = point[1]
-        for trig in self.triggers:
-            trig.active = True
+        if self.snapshotTiles == None:
+            return
+        # Only the tiles written since the snapshot differ from it
+        changed, self.changedTiles = self.changedTiles, set()
+        snapshotTiles = self.snapshotTiles
+        for index in changed:
+            if self.map[index] != snapshotTiles[index]:
+                self.SetTile(index, snapshotTiles[index])
+        self.changedTiles.clear()
+        for trig, active in zip(self.triggers, self.snapshotTriggers):
+            trig.active = active != 0
+        self.endpoint = self.snapshotEndpoint
         # Reset spawnpoint
         self.spawnpoint = self.startpoint
 
     def RemoveRingTrigger(self, trigger : Box):
-        rpos = (trigger.position - Vector2(self.gridsize / 4, 0)) / self.gridsize
-        index = int(rpos.y) * self.mapDim[0] + int(rpos.x)
-        self.map[index] = LevelMap.TilesToIndexMap["-"]
+        self.SetTile(trigger.index, LevelMap.TilesToIndexMap["-"])
 
     def ActivateCheckpointTrigger(self, trigger : Box):
-        rpos = trigger.position / self.gridsize
-        index = int(rpos.y) * self.mapDim[0] + int(rpos.x)
-        self.map[index] = LevelMap.TilesToIndexMap["Checkpoint_Active"]
-        self.spawnpoint = rpos + Vector2(0, -1)
+        self.SetTile(trigger.index, LevelMap.TilesToIndexMap["Checkpoint_Active"])
+        self.spawnpoint = trigger.position / self.gridsize + Vector2(0, -1)
 
     def ActivateEndpoint(self, trigger: Box):
-        # Iterate over the entire map and replace all occurrences of 10 (NotEnd) with 7 (Endpoint)
-        for i in range(len(self.map)):
-            if self.map[i] == LevelMap.TilesToIndexMap["Endpoint"]:
-                self.map[i] = LevelMap.TilesToIndexMap["NotEnd"]  # Change 10 to 7 (Endpoint)
+        # Replace every Endpoint (7) tile with NotEnd (10)
+        for index in list(self.FindTiles(LevelMap.TilesToIndexMap["Endpoint"])):
+            self.SetTile(index, LevelMap.TilesToIndexMap["NotEnd"])
         
         # Optionally, you can update the endpoint position if needed (based on your game logic)
         rpos = trigger.position / self.gridsize
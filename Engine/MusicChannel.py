@@ -0,0 +1,96 @@
+import wave
+import pygame
+from Engine.DebugLog import Debug
+
+class MusicTrack:
+    def __init__(self, name, path, volume = 1.0):
+        self.name = name
+        self.path = path
+        self.volume = volume
+        self.length = MusicTrack.__readLength(path) # seconds, None when unknown
+        self.position = 0.0 # seconds, where the next Play() of it starts
+
+    @staticmethod
+    def __readLength(path):
+        try:
+            with wave.open(path, "rb") as f:
+                return f.getnframes() / f.getframerate()
+        except (wave.Error, EOFError, OSError):
+            return None
+
+# Long tracks streamed from disk through pygame.mixer.music instead of decoded whole into a Sound
+# One track plays at a time, switching fades the playing one out then the next one in, and a track resumes where it was left
+class MusicChannel:
+    FADE_MS = 600
+
+    def __init__(self):
+        self.tracks = {} # name -> MusicTrack
+        self.current : MusicTrack = None # playing, None while fading out
+        self.next : MusicTrack = None # started by Update() once the fade out is done
+        self.nextLoops = -1
+        self.nextFadeMs = 0
+        self.startPosition = 0.0 # seconds into current where its playback started
+
+    def AddTrack(self, track : MusicTrack):
+        self.tracks[track.name] = track
+
+    def GetTrack(self, name) -> MusicTrack:
+        return self.tracks.get(name)
+
+    def Play(self, name, loops = -1, fadeMs = FADE_MS):
+        track = self.tracks.get(name)
+        if track == None:
+            Debug.Warn(f'Music track \"{name}\" does not exist')
+            return
+        if track is self.current and pygame.mixer.music.get_busy():
+            return
+        self.next, self.nextLoops, self.nextFadeMs = track, loops, fadeMs
+        if pygame.mixer.music.get_busy():
+            self.__fadeOut(fadeMs)
+        else:
+            self.__startNext()
+
+    def Stop(self, fadeMs = FADE_MS):
+        self.next = None
+        if fadeMs > 0:
+            self.__fadeOut(fadeMs)
+        else:
+            self.__rememberPosition()
+            pygame.mixer.music.stop()
+            self.current = None
+
+    # Once per frame, starts the next track when the fade out is done
+    def Update(self):
+        if self.next != None and not pygame.mixer.music.get_busy():
+            self.__startNext()
+
+    # Seconds into the current track
+    def GetPosition(self):
+        played = pygame.mixer.music.get_pos()
+        if self.current == None or played < 0:
+            return 0.0
+        position = self.startPosition + played / 1000.0
+        return position % self.current.length if self.current.length else position
+
+    def __fadeOut(self, fadeMs):
+        if self.current != None:
+            self.__rememberPosition()
+            pygame.mixer.music.fadeout(fadeMs)
+            self.current = None
+
+    def __rememberPosition(self):
+        if self.current != None and pygame.mixer.music.get_pos() >= 0:
+            self.current.position = self.GetPosition()
+
+    def __startNext(self):
+        track, self.next = self.next, None
+        try:
+            pygame.mixer.music.load(track.path)
+            pygame.mixer.music.set_volume(track.volume)
+            pygame.mixer.music.play(self.nextLoops, start=track.position, fade_ms=self.nextFadeMs)
+        except pygame.error as e:
+            Debug.Warn(f'Could not stream {track.path} : {e}')
+            self.current = None
+            return
+        self.current = track
+        self.startPosition = track.position
@@ -0,0 +1,38 @@
+import time
+
+# Lightweight section timer and counters, does nothing unless enabled (e.g. by benchmark.py)
+class Profiler:
+    enabled = False
+    sections = {} # name -> [calls, total seconds]
+    counters = {} # name -> value
+
+    @staticmethod
+    def Start():
+        return time.perf_counter() if Profiler.enabled else 0.0
+
+    @staticmethod
+    def Stop(name, start):
+        if Profiler.enabled:
+            section = Profiler.sections.get(name)
+            if section == None:
+                section = Profiler.sections[name] = [0, 0.0]
+            section[0] += 1
+            section[1] += time.perf_counter() - start
+
+    @staticmethod
+    def Count(name, amount = 1):
+        if Profiler.enabled:
+            Profiler.counters[name] = Profiler.counters.get(name, 0) + amount
+
+    @staticmethod
+    def Reset():
+        Profiler.sections.clear()
+        Profiler.counters.clear()
+
+    @staticmethod
+    def Report(frames = 1):
+        frames = max(frames, 1)
+        return {"sections" : {name : {"calls" : s[0], "totalMs" : s[1] * 1000.0, "perFrameMs" : s[1] * 1000.0 / frames}
+                              for name, s in Profiler.sections.items()},
+                "counters" : {name : {"total" : value, "perFrame" : value / frames}
+                              for name, value in Profiler.counters.items()}}
@@ -1,48 +1,258 @@
 import pygame
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from Engine.AssetCache import AssetCache
 from Engine.DebugLog import Debug
+from Engine.LevelCache import LevelCache
+from Engine.MusicChannel import MusicChannel
 from Engine.Resources import Audio, Texture2D
+from Engine.TextureAtlas import TextureAtlas
 
 class ResourceFont:
     def __init__(self):
         self.fontName = None
-        self.font : pygame.font.Font = None
+        self.font : pygame.font.Font = None # Default size font
+        self.pool = {} # size -> pygame.font.Font
+
+    def GetFont(self, size) -> pygame.font.Font:
+        font = self.pool.get(size)
+        if font == None:
+            font = pygame.font.SysFont(self.fontName, size)
+            self.pool[size] = font
+        return font
+
+# Files decoded on a loader thread, finish(result) turns the result into resources on the main thread
+class LoadJob:
+    def __init__(self, future : Future, finish):
+        self.future = future
+        self.finish = finish
+        self.finished = False
 
 class ResourceManager:
+    SCALED_CACHE_CAPACITY = 256 # Max number of pre-scaled surfaces kept around
+    TEXT_CACHE_CAPACITY = 128 # Max number of rendered text surfaces kept around
+    LOAD_WORKERS = 4 # Loader threads, pygame decodes images / WAVs without holding the GIL
+
     def __init__(self):
         self.textureList = {}
         self.audioClipList = {}
         self.myFont = ResourceFont()
+        # (texName, width, height) -> pygame.Surface, oldest first
+        self.scaledTextureCache = OrderedDict()
+        # (text, color, size) -> pygame.Surface, oldest first
+        self.textCache = OrderedDict()
+        self.textCacheHits = 0
+        self.textCacheMisses = 0
+        self.atlas = TextureAtlas()
+        self.levelCache = LevelCache(64) # GridSize = 64x64
+        self.music = MusicChannel() # Long tracks, streamed. Short sounds are audio clips
+        # Asynchronous loading, a resource still loading is waited for by the first Get...() of it
+        self.loader : ThreadPoolExecutor = None # Started by the first Load...Async()
+        self.loadJobs = [] # unfinished LoadJobs
+        self.loadedCount = 0 # finished LoadJobs
+        self.pendingTextures = {} # name -> LoadJob
+        self.pendingAudioClips = {} # name -> LoadJob
+        self.pendingAlphas = {} # name -> alpha of SetTextureAlpha() calls on a texture still loading
+        self.atlasJob : LoadJob = None
+        self.assetCache : AssetCache = None # Decoded images / sounds on disk, None decodes every file each time
         pass
     
+    def __submit(self, decode, finish, *args):
+        if self.loader == None:
+            self.loader = ThreadPoolExecutor(max_workers=ResourceManager.LOAD_WORKERS, thread_name_prefix="Loader")
+        job = LoadJob(self.loader.submit(decode, *args), finish)
+        self.loadJobs.append(job)
+        return job
+
+    # Waits for the decoding when it isn't done yet
+    def __finishJob(self, job : LoadJob):
+        if job.finished:
+            return
+        job.finished = True
+        self.loadJobs.remove(job)
+        self.loadedCount += 1
+        job.finish(job.future.result())
+
+    # Finishes every load whose decoding is done without waiting, call once per frame while IsLoading()
+    def FinishLoaded(self):
+        for job in [job for job in self.loadJobs if job.future.done()]:
+            self.__finishJob(job)
+
+    def IsLoading(self):
+        return len(self.loadJobs) > 0
+
+    # (finished, total) loads
+    def GetLoadProgress(self):
+        return self.loadedCount, self.loadedCount + len(self.loadJobs)
+
     def AddAudioClip(self, audio):
         self.audioClipList[audio.name] = audio
 
     def GetAudioClip(self, name) -> Audio:
+        job = self.pendingAudioClips.get(name)
+        if job != None:
+            self.__finishJob(job)
         return self.audioClipList.get(name)
 
+    # manifest: [(name, path, volume)]. Returns the Futures of the decoded pygame.mixer.Sounds
+    def LoadAudioClipsAsync(self, manifest):
+        futures = []
+        for name, path, volume in manifest:
+            job = self.__submit(self.__decodeSound, partial(self.__finishAudioClip, name, path, volume), path)
+            self.pendingAudioClips[name] = job
+            futures.append(job.future)
+        return futures
+
+    def __finishAudioClip(self, name, path, volume, sound : pygame.mixer.Sound):
+        self.pendingAudioClips.pop(name, None)
+        sound.set_volume(volume)
+        self.AddAudioClip(Audio(name, path, sound))
+
     def AddTexture(self, tex):
+        if tex.name in self.textureList:
+            self.InvalidateScaledTexture(tex.name)
+            self.atlas.Exclude(tex.name)
         self.textureList[tex.name] = tex
 
     def GetTexture(self, name) -> Texture2D:
+        job = self.pendingTextures.get(name)
+        if job != None:
+            self.__finishJob(job)
         return self.textureList.get(name)
+
+    def GetAtlas(self) -> TextureAtlas:
+        if self.atlasJob != None:
+            self.__finishJob(self.atlasJob)
+        return self.atlas
     
     def RemoveTexture(self, name):
         self.textureList.pop(name)
+        self.InvalidateScaledTexture(name)
+        self.atlas.Exclude(name)
+
+    # manifest: [(name, path)], atlasNames: texture names in atlas id order (None for ids without texture)
+    def LoadTextureAtlas(self, manifest, atlasNames, cacheDir = None):
+        self.__finishAtlas(manifest, atlasNames, cacheDir, self.__decodeAtlas(manifest, atlasNames, cacheDir))
+
+    # Same as LoadTextureAtlas() with the files decoded on a loader thread. Returns the Future of the decoding
+    def LoadTextureAtlasAsync(self, manifest, atlasNames, cacheDir = None):
+        job = self.__submit(self.__decodeAtlas, partial(self.__finishAtlas, manifest, atlasNames, cacheDir),
+                            manifest, atlasNames, cacheDir)
+        self.atlasJob = job
+        for name, path in manifest:
+            self.pendingTextures[name] = job
+        return job.future
+
+    # File decoding only, surfaces are converted to the display format by __finishAtlas() on the main thread
+    # Returns (cached atlas, None) or (None, name -> pygame.Surface)
+    def __decodeAtlas(self, manifest, atlasNames, cacheDir):
+        atlas = TextureAtlas()
+        if cacheDir != None and atlas.LoadCache(cacheDir, manifest, atlasNames, convert=False):
+            return atlas, None
+        return None, {name : self.__decodeImage(path) for name, path in manifest}
+
+    # Safe on the loader threads
+    def __decodeImage(self, path) -> pygame.Surface:
+        return pygame.image.load(path) if self.assetCache == None else self.assetCache.LoadImage(path)
+
+    def __decodeSound(self, path) -> pygame.mixer.Sound:
+        return pygame.mixer.Sound(path) if self.assetCache == None else self.assetCache.LoadSound(path)
+
+    def __finishAtlas(self, manifest, atlasNames, cacheDir, decoded):
+        atlas, surfaces = decoded
+        for name, path in manifest:
+            self.pendingTextures.pop(name, None)
+        if atlas != None:
+            # Cached atlas is up to date, textures become regions of it and no PNG is decoded
+            atlas.surface = atlas.surface.convert_alpha()
+            for name, path in manifest:
+                rect = atlas.GetRectByName(name)
+                surface = self.__decodeImage(path).convert_alpha() if rect == None else atlas.surface.subsurface(rect)
+                self.AddTexture(Texture2D(name, path, surface))
+        else:
+            atlas = TextureAtlas()
+            for name, path in manifest:
+                self.AddTexture(Texture2D(name, path, surfaces[name].convert_alpha()))
+            atlas.Build(atlasNames, {name : self.textureList[name].tex for name, path in manifest})
+            if cacheDir != None:
+                atlas.SaveCache(cacheDir, manifest, atlasNames)
+        self.atlas = atlas
+        self.atlasJob = None
+        for name in [name for name, path in manifest if name in self.pendingAlphas]:
+            self.SetTextureAlpha(name, self.pendingAlphas.pop(name))
+
+    def SetTextureAlpha(self, name, alpha):
+        if name in self.pendingTextures:
+            # Applied once it is loaded
+            self.pendingAlphas[name] = alpha
+            return
+        # The atlas surface is shared, so a texture with its own alpha is blitted from its own surface
+        self.textureList[name].tex.set_alpha(alpha)
+        self.InvalidateScaledTexture(name)
+        self.atlas.Exclude(name)
+
+    def GetScaledTexture(self, name, scale) -> pygame.Surface:
+        texture = self.GetTexture(name)
+        if texture == None:
+            return None
+        # Nothing to scale, use the source surface as is
+        if scale.x == 1 and scale.y == 1:
+            return texture.tex
+        size = texture.GetNewSizeAfterScale(scale)
+        key = (name, int(size.x), int(size.y))
+        surface = self.scaledTextureCache.get(key)
+        if surface != None:
+            self.scaledTextureCache.move_to_end(key)
+            return surface
+        surface = pygame.transform.scale(texture.tex, (key[1], key[2]))
+        self.scaledTextureCache[key] = surface
+        if len(self.scaledTextureCache) > ResourceManager.SCALED_CACHE_CAPACITY:
+            self.scaledTextureCache.popitem(last=False)
+        return surface
+
+    def InvalidateScaledTexture(self, name):
+        for key in [key for key in self.scaledTextureCache if key[0] == name]:
+            del self.scaledTextureCache[key]
     
     def InitFont(self, font = None, size = 24):
         self.myFont.fontName = font
-        self.myFont.font = pygame.font.SysFont(font, size)
+        self.myFont.pool.clear()
+        self.myFont.font = self.myFont.GetFont(size)
+        self.textCache.clear()
     
     def RenderFont(self, text, color = (255,255,255), size = 24) -> pygame.Surface:
         if self.myFont.font == None:
             Debug.Error("Forget to call InitFont()")
-        if size != self.myFont.font.size:
-            self.InitFont(self.myFont.fontName, size)
-        return self.myFont.font.render(text, True, color)
+        key = (text, tuple(color), size)
+        surface = self.textCache.get(key)
+        if surface != None:
+            self.textCacheHits += 1
+            self.textCache.move_to_end(key)
+            return surface
+        self.textCacheMisses += 1
+        surface = self.myFont.GetFont(size).render(text, True, color)
+        self.textCache[key] = surface
+        if len(self.textCache) > ResourceManager.TEXT_CACHE_CAPACITY:
+            self.textCache.popitem(last=False)
+        return surface
+
+    def GetTextCacheStats(self):
+        total = self.textCacheHits + self.textCacheMisses
+        return {"hits" : self.textCacheHits, "misses" : self.textCacheMisses,
+                "hitRate" : self.textCacheHits / total if total > 0 else 0.0,
+                "size" : len(self.textCache), "capacity" : ResourceManager.TEXT_CACHE_CAPACITY}
 
     def PrettyPrint(self):
         string = f'Loaded Textures ({len(self.textureList)}):\n'
         for texName in self.textureList:
             string += f'- {texName}\n'
-        string += f'\n Loaded Font ({self.myFont.fontName})\n'
+        string += f'\n Loaded Font ({self.myFont.fontName}), sizes : {sorted(self.myFont.pool)}\n'
+        string += f' Text cache : {self.GetTextCacheStats()}\n'
         Debug.Log(string)
+
+    def Shutdown(self):
+        if self.loader != None:
+            self.loader.shutdown(wait=True, cancel_futures=True)
+            self.loader = None
+        self.levelCache.Shutdown()
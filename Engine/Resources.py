@@ -3,20 +3,22 @@ import pygame
 from Engine.Vector2 import Vector2
 
 class Texture2D:
-    def __init__(self, name, path):
+    def __init__(self, name, path, surface : pygame.Surface = None):
         self.name = name
         self.path = path
-        self.tex = pygame.image.load(os.path.join(path)).convert_alpha()
+        # surface: already decoded pixels, e.g. a region of the texture atlas
+        self.tex = pygame.image.load(os.path.join(path)).convert_alpha() if surface == None else surface
         self.rect = Vector2(self.tex.get_rect()[2], self.tex.get_rect()[3])
     
     def GetNewSizeAfterScale(self, scale : Vector2):
         return Vector2(self.rect.x * scale.x, self.rect.y * scale.y)
 
 class Audio:
-    def __init__(self, name, path):
+    def __init__(self, name, path, source : pygame.mixer.Sound = None):
         self.name = name
         self.path = path
-        self.source : pygame.mixer.Sound = pygame.mixer.Sound(path)
+        # source: already decoded sound, e.g. by ResourceManager's loader threads
+        self.source : pygame.mixer.Sound = pygame.mixer.Sound(path) if source == None else source
     
     def Play(self):
         self.source.play()
\ No newline at end of file
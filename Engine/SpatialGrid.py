@@ -0,0 +1,53 @@
+from Engine.Profiler import Profiler
+
+# Uniform grid over boxes (anything with position / size Vector2), cell -> indices of the boxes overlapping it
+class SpatialGrid:
+    def __init__(self, cellSize):
+        self.cellSize = cellSize
+        self.cells = {} # (cx, cy) -> [box index]
+        self.boxes = []
+        self.queryCount = 0
+        self.candidateCount = 0
+
+    def Build(self, boxes):
+        self.cells.clear()
+        self.boxes = boxes
+        cellSize = self.cellSize
+        for index, box in enumerate(boxes):
+            cx0, cy0 = int(box.position.x // cellSize), int(box.position.y // cellSize)
+            cx1 = int((box.position.x + box.size.x) // cellSize)
+            cy1 = int((box.position.y + box.size.y) // cellSize)
+            for cy in range(cy0, cy1 + 1):
+                for cx in range(cx0, cx1 + 1):
+                    cell = self.cells.get((cx, cy))
+                    if cell == None:
+                        self.cells[(cx, cy)] = [index]
+                    else:
+                        cell.append(index)
+
+    # Indices of the boxes whose cells overlap the circle's bounds, in ascending order
+    def QueryIndices(self, center, radius):
+        cellSize = self.cellSize
+        cx0, cy0 = int((center.x - radius) // cellSize), int((center.y - radius) // cellSize)
+        cx1, cy1 = int((center.x + radius) // cellSize), int((center.y + radius) // cellSize)
+        cells = self.cells
+        found = set()
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                cell = cells.get((cx, cy))
+                if cell != None:
+                    found.update(cell)
+        self.queryCount += 1
+        self.candidateCount += len(found)
+        Profiler.Count("gridQueries")
+        Profiler.Count("gridCandidates", len(found))
+        return sorted(found)
+
+    # Boxes whose cells overlap the circle's bounds, in the same order as the boxes list
+    def Query(self, center, radius):
+        boxes = self.boxes
+        return [boxes[index] for index in self.QueryIndices(center, radius)]
+
+    def ResetStats(self):
+        self.queryCount = 0
+        self.candidateCount = 0
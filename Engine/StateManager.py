@@ -44,6 +44,10 @@ class StateManager:
         else:
             Debug.Warn(f'{self.currentState} does not exist')
 
+    def IsCurrentStateIdle(self):
+        state = self.states.get(self.currentState)
+        return state != None and state.IsIdle()
+
     def UnloadCurrentState(self):
         if self.currentState == "None":
             Debug.Warn("State not specified before InitializeState()")
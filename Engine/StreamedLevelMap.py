@@ -0,0 +1,239 @@
+import mmap
+import os
+import struct
+from Engine.DebugLog import Debug
+from Engine.LevelMap import LevelMap
+from Engine.Profiler import Profiler
+from Engine.Vector2 import Vector2
+
+class StreamChunk:
+    def __init__(self, cx, cy, x0, y0, width, height):
+        self.cx = cx
+        self.cy = cy
+        self.x0 = x0 # top left tile
+        self.y0 = y0
+        self.width = width # in tiles, edge chunks are smaller
+        self.height = height
+        self.tiles : bytearray = None # current tiles, rings picked up / checkpoints activated included
+        self.colliders = []
+        self.triggers = []
+        self.wallTiles = 0
+        self.modified = False # tiles differ from the file
+
+# Stand-in for LevelMap.map, a flat tile index reads / writes the chunk holding it (loaded on demand)
+class StreamedTiles:
+    def __init__(self, levelMap):
+        self.levelMap = levelMap
+
+    def __len__(self):
+        return self.levelMap.mapDim[0] * self.levelMap.mapDim[1]
+
+    def __getitem__(self, index):
+        chunk, offset = self.levelMap.LocateTile(index)
+        return chunk.tiles[offset]
+
+    def __setitem__(self, index, value):
+        chunk, offset = self.levelMap.LocateTile(index)
+        chunk.tiles[offset] = value
+        chunk.modified = True
+
+# LevelMap for maps too large to keep whole. Tiles are read from a raw tile file through mmap in chunks around
+# the player, colliders and triggers exist only for the resident chunks. An evicted chunk that was modified keeps
+# its tiles, its triggers are regenerated from the file and switched off where the tile was used up
+class StreamedLevelMap(LevelMap):
+    STREAM_MIN_BYTES = 64 * 1024 # .dat files at least this big are streamed
+    TILE_MAGIC = b"WBTS"
+    TILE_VERSION = 1
+    TILE_HEADER = struct.Struct("<4sHIIiiii") # magic, version, width, height, start x/y, end x/y
+    # Triggers used up by touching them, active only while their tile is still in place
+    CONSUMABLE = (LevelMap.TilesToIndexMap["Ring"], LevelMap.TilesToIndexMap["Checkpoint_NotActive"],
+                  LevelMap.TilesToIndexMap["JumpBoost"], LevelMap.TilesToIndexMap["SpeedBoost"])
+
+    def __init__(self, gridsize, chunkSize = 16):
+        super().__init__(gridsize)
+        self.chunkSize = chunkSize # in tiles
+        self.chunkDim = (0, 0)
+        self.map = StreamedTiles(self)
+        self.tileIndex = None # the chunks stand in for it, resident tiles are scanned directly
+        self.chunks = {} # (cx, cy) -> resident StreamChunk
+        self.savedTiles = {} # (cx, cy) -> tiles of modified chunks that were evicted
+        self.tileFile : mmap.mmap = None
+        self.streamRange = None # (cx0, cy0, cx1, cy1) inclusive, last StreamAround()
+        self.queriesStale = False
+        self.endpointsOpened = False
+        self.streamStats = {"loads" : 0, "evictions" : 0}
+
+    @staticmethod
+    def ShouldStream(path):
+        try:
+            return os.path.getsize(path) >= StreamedLevelMap.STREAM_MIN_BYTES
+        except OSError:
+            return False
+
+    @staticmethod
+    def GetTilePath(path):
+        compiledPath = LevelMap.GetCompiledPath(path)
+        return os.path.splitext(compiledPath if compiledPath != None else path)[0] + ".tiles"
+
+    # Opens the level, converting the .dat into a tile file first when it is missing or older than the .dat
+    def Load(self, path):
+        tilePath = StreamedLevelMap.GetTilePath(path)
+        try:
+            fresh = os.stat(tilePath).st_mtime_ns > os.stat(path).st_mtime_ns
+        except OSError:
+            fresh = False
+        if not fresh:
+            StreamedLevelMap.__convert(path, tilePath)
+        with open(tilePath, "rb") as f:
+            self.tileFile = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, width, height, startX, startY, endX, endY = StreamedLevelMap.TILE_HEADER.unpack_from(self.tileFile)
+        if magic != StreamedLevelMap.TILE_MAGIC or version != StreamedLevelMap.TILE_VERSION:
+            raise ValueError(f'{tilePath} is not a tile file')
+        self.mapDim = (width, height)
+        self.chunkDim = (-(-width // self.chunkSize), -(-height // self.chunkSize))
+        self.startpoint = Vector2(startX, startY)
+        self.spawnpoint = self.startpoint
+        self.endpoint = Vector2(endX, endY)
+        self.snapshotEndpoint = self.endpoint
+        self.chunks.clear()
+        self.savedTiles.clear()
+        self.dirtyTiles.clear()
+        self.colliders.clear()
+        self.triggers.clear()
+        self.streamRange = None
+        self.endpointsOpened = False
+        self.BuildQueries()
+        Debug.Log(f'Streaming {path} ({width} x {height} tiles)')
+
+    # Row by row, the whole map is never held in memory
+    @staticmethod
+    def __convert(path, tilePath):
+        os.makedirs(os.path.dirname(tilePath) or ".", exist_ok=True)
+        Header = StreamedLevelMap.TILE_HEADER
+        start, end = (0, 0), (0, 0)
+        width, height = 0, 0
+        with open(path, "r") as source, open(tilePath + ".tmp", "wb") as f:
+            f.write(bytes(Header.size))
+            for line in source:
+                if not line.strip():
+                    continue
+                row = [int(value, 10) for value in line.split(',')]
+                if height == 0:
+                    width = len(row)
+                elif len(row) != width:
+                    raise ValueError(f'{path} row {height} has {len(row)} tiles, expected {width}')
+                for x, value in enumerate(row):
+                    if value == LevelMap.TilesToIndexMap["Startpoint"]:
+                        start = (x, height)
+                    elif value == LevelMap.TilesToIndexMap["Endpoint"]:
+                        end = (x, height)
+                f.write(bytes(row))
+                height += 1
+            f.seek(0)
+            f.write(Header.pack(StreamedLevelMap.TILE_MAGIC, StreamedLevelMap.TILE_VERSION, width, height,
+                                start[0], start[1], end[0], end[1]))
+        os.replace(tilePath + ".tmp", tilePath)
+
+    def LocateTile(self, index):
+        width = self.mapDim[0]
+        x, y = index % width, index // width
+        chunk = self.chunks.get((x // self.chunkSize, y // self.chunkSize))
+        if chunk == None:
+            # Outside the streamed area, e.g. drawn past the margin, colliders follow on the next StreamAround()
+            chunk = self.__loadChunk(x // self.chunkSize, y // self.chunkSize)
+            self.queriesStale = True
+        return chunk, (y - chunk.y0) * chunk.width + (x - chunk.x0)
+
+    def __readTiles(self, chunk : StreamChunk):
+        width = self.mapDim[0]
+        base = StreamedLevelMap.TILE_HEADER.size
+        tiles = bytearray()
+        for y in range(chunk.y0, chunk.y0 + chunk.height):
+            offset = base + y * width + chunk.x0
+            tiles += self.tileFile[offset:offset + chunk.width]
+        return tiles
+
+    def __loadChunk(self, cx, cy):
+        t = Profiler.Start()
+        x0, y0 = cx * self.chunkSize, cy * self.chunkSize
+        chunk = StreamChunk(cx, cy, x0, y0, min(self.chunkSize, self.mapDim[0] - x0), min(self.chunkSize, self.mapDim[1] - y0))
+        original = self.__readTiles(chunk)
+        saved = self.savedTiles.pop((cx, cy), None)
+        chunk.tiles = saved if saved != None else bytearray(original)
+        chunk.modified = saved != None
+        if self.endpointsOpened:
+            self.__openEndpoints(chunk)
+        # Boxes always come from the file, like a whole level generated once at load
+        chunk.wallTiles = self.GenerateRegion(list(original), chunk.width, chunk.height, x0, y0,
+                                              chunk.colliders, chunk.triggers)
+        for trigger in chunk.triggers:
+            if trigger.kind in StreamedLevelMap.CONSUMABLE:
+                offset = (trigger.index // self.mapDim[0] - y0) * chunk.width + (trigger.index % self.mapDim[0] - x0)
+                trigger.active = chunk.tiles[offset] == trigger.kind
+        self.chunks[(cx, cy)] = chunk
+        self.streamStats["loads"] += 1
+        Profiler.Stop("streamLoad", t)
+        return chunk
+
+    def __evictChunk(self, key):
+        chunk = self.chunks.pop(key)
+        if chunk.modified:
+            self.savedTiles[key] = chunk.tiles
+        self.streamStats["evictions"] += 1
+
+    def StreamAround(self, center : Vector2, extent : Vector2):
+        span = self.gridsize * self.chunkSize
+        last = (self.chunkDim[0] - 1, self.chunkDim[1] - 1)
+        cx0 = min(max(int((center.x - extent.x) // span), 0), last[0])
+        cy0 = min(max(int((center.y - extent.y) // span), 0), last[1])
+        cx1 = min(max(int((center.x + extent.x) // span), 0), last[0])
+        cy1 = min(max(int((center.y + extent.y) // span), 0), last[1])
+        streamRange = (cx0, cy0, cx1, cy1)
+        if streamRange == self.streamRange and not self.queriesStale:
+            return False
+        self.streamRange = streamRange
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                if (cx, cy) not in self.chunks:
+                    self.__loadChunk(cx, cy)
+        # One chunk of slack before evicting, so walking back and forth over a border doesn't reload
+        for key in [key for key in self.chunks if not (cx0 - 1 <= key[0] <= cx1 + 1 and cy0 - 1 <= key[1] <= cy1 + 1)]:
+            self.__evictChunk(key)
+        # Chunk order is row-major, triggers are handled in about the same order as a whole level's
+        resident = [self.chunks[key] for key in sorted(self.chunks, key=lambda key: (key[1], key[0]))]
+        self.colliders = [collider for chunk in resident for collider in chunk.colliders]
+        self.triggers = [trigger for chunk in resident for trigger in chunk.triggers]
+        self.colliderStats = {"wallTiles" : sum(chunk.wallTiles for chunk in resident), "colliders" : len(self.colliders)}
+        self.BuildQueries()
+        self.queriesStale = False
+        return True
+
+    def __openEndpoints(self, chunk : StreamChunk):
+        tiles = chunk.tiles
+        for offset in range(len(tiles)):
+            if tiles[offset] == LevelMap.TilesToIndexMap["Endpoint"]:
+                tiles[offset] = LevelMap.TilesToIndexMap["NotEnd"]
+                chunk.modified = True
+                self.dirtyTiles.append((chunk.y0 + offset // chunk.width) * self.mapDim[0] + chunk.x0 + offset % chunk.width)
+
+    # Same tile swap as LevelMap.ActivateEndpoint(), resident chunks now and the rest as they stream in
+    def ActivateEndpoint(self, trigger):
+        self.endpointsOpened = True
+        for chunk in self.chunks.values():
+            self.__openEndpoints(chunk)
+        self.endpoint = trigger.position / self.gridsize
+
+    def Reset(self):
+        self.savedTiles.clear()
+        self.endpointsOpened = False
+        for chunk in self.chunks.values():
+            original = self.__readTiles(chunk)
+            for offset in range(len(original)):
+                if chunk.tiles[offset] != original[offset]:
+                    self.SetTile((chunk.y0 + offset // chunk.width) * self.mapDim[0] + chunk.x0 + offset % chunk.width,
+                                 original[offset])
+            chunk.modified = False
+        for trig in self.triggers:
+            trig.active = True
+        self.endpoint = self.snapshotEndpoint
+        self.spawnpoint = self.startpoint
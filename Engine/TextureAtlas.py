@@ -0,0 +1,111 @@
+import json
+import os
+import zlib
+import pygame
+from Engine.DebugLog import Debug
+
+class TextureAtlas:
+    VERSION = 2
+
+    def __init__(self, maxWidth = 1024, maxHeight = 2048):
+        self.maxSize = (maxWidth, maxHeight)
+        self.surface : pygame.Surface = None
+        self.rects = [] # id -> pygame.Rect inside surface, None when not packed
+        self.names = [] # id -> name
+        self.ids = {} # name -> id
+
+    def GetId(self, name):
+        return self.ids.get(name, -1)
+
+    def GetRect(self, id) -> pygame.Rect:
+        return self.rects[id] if 0 <= id < len(self.rects) else None
+
+    def GetRectByName(self, name) -> pygame.Rect:
+        return self.GetRect(self.GetId(name))
+
+    # Stop serving a texture from the atlas, e.g. it was replaced or has its own surface alpha
+    def Exclude(self, name):
+        id = self.GetId(name)
+        if id != -1:
+            self.rects[id] = None
+
+    # names: texture names in id order (None for ids without a texture), surfaces: name -> pygame.Surface
+    def Build(self, names, surfaces):
+        self.names = list(names)
+        self.ids = {name : id for id, name in enumerate(names) if name != None}
+        self.rects = [None] * len(names)
+        # Shelf packing, tallest first
+        order = sorted((id for id, name in enumerate(names) if name in surfaces),
+                       key=lambda id: (-surfaces[names[id]].get_height(), -surfaces[names[id]].get_width()))
+        x, y, shelfHeight, usedWidth = 0, 0, 0, 0
+        for id in order:
+            w, h = surfaces[names[id]].get_size()
+            if w > self.maxSize[0]:
+                Debug.Warn(f'{names[id]} is too wide for the texture atlas')
+                continue
+            if x + w > self.maxSize[0]:
+                x, y, shelfHeight = 0, y + shelfHeight, 0
+            if y + h > self.maxSize[1]:
+                Debug.Warn(f'Texture atlas is full, {names[id]} is not packed')
+                continue
+            self.rects[id] = pygame.Rect(x, y, w, h)
+            x += w
+            shelfHeight = max(shelfHeight, h)
+            usedWidth = max(usedWidth, x)
+        self.surface = pygame.Surface((max(usedWidth, 1), max(y + shelfHeight, 1)), pygame.SRCALPHA)
+        self.surface.fill((0, 0, 0, 0))
+        for id, rect in enumerate(self.rects):
+            if rect != None:
+                # MAX against a cleared surface copies the pixels as is, alpha included
+                self.surface.blit(surfaces[names[id]], rect, special_flags=pygame.BLEND_RGBA_MAX)
+
+    @staticmethod
+    def __describeSources(manifest):
+        sources = []
+        for name, path in manifest:
+            stat = os.stat(path)
+            sources.append([name, path, stat.st_mtime_ns, stat.st_size])
+        return sources
+
+    def SaveCache(self, cacheDir, manifest, names):
+        try:
+            os.makedirs(cacheDir, exist_ok=True)
+            # Raw RGBA pixels, loading them back is a copy instead of a PNG decode
+            pixels = pygame.image.tobytes(self.surface, "RGBA")
+            with open(os.path.join(cacheDir, "atlas.raw"), "wb") as f:
+                f.write(pixels)
+            layout = {"version" : TextureAtlas.VERSION,
+                      "names" : list(names),
+                      "sources" : TextureAtlas.__describeSources(manifest),
+                      "size" : list(self.surface.get_size()),
+                      "checksum" : zlib.crc32(pixels),
+                      "rects" : [list(rect) if rect != None else None for rect in self.rects]}
+            with open(os.path.join(cacheDir, "atlas.json"), "w") as f:
+                json.dump(layout, f)
+        except (OSError, pygame.error) as e:
+            Debug.Warn(f'Could not write texture atlas cache : {e}')
+
+    # Returns False when there is no cache or any source texture changed since it was written
+    # convert: False leaves the surface in its file format, e.g. when loading off the main thread
+    def LoadCache(self, cacheDir, manifest, names, convert = True):
+        try:
+            with open(os.path.join(cacheDir, "atlas.json"), "r") as f:
+                layout = json.load(f)
+            if (layout["version"] != TextureAtlas.VERSION or layout["names"] != list(names) or
+                layout["sources"] != TextureAtlas.__describeSources(manifest)):
+                return False
+            with open(os.path.join(cacheDir, "atlas.raw"), "rb") as f:
+                pixels = f.read()
+            width, height = layout["size"]
+            if len(pixels) != width * height * 4 or zlib.crc32(pixels) != layout["checksum"]:
+                Debug.Warn("Texture atlas cache is corrupt, rebuilding it")
+                return False
+            self.surface = pygame.image.frombytes(pixels, (width, height), "RGBA")
+            if convert:
+                self.surface = self.surface.convert_alpha()
+        except (OSError, ValueError, KeyError, pygame.error):
+            return False
+        self.names = list(names)
+        self.ids = {name : id for id, name in enumerate(names) if name != None}
+        self.rects = [pygame.Rect(rect) if rect != None else None for rect in layout["rects"]]
+        return True
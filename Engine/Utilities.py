@@ -1,4 +1,8 @@
 from Engine.Vector2 import Vector2
+try:
+    import numpy as np
+except ImportError: # Optional, only the batched tests need it
+    np = None
 
 class MYCOLOR:
     BLACK  = (0, 0, 0)
@@ -11,9 +15,14 @@ class MYCOLOR:
 
 
 class CollisionData:
-    def __init__(self):
-        self.hit = False
-        self.contactPoint = Vector2()
+    __slots__ = ("hit", "contactPoint")
+
+    def __init__(self, hit = False, contactPoint = None):
+        self.hit = hit
+        self.contactPoint = Vector2() if contactPoint == None else contactPoint
+
+# Shared result for every miss, treat as read only
+NO_COLLISION = CollisionData()
 
 def PointAABB(pt, topleft, bottomright):
     #data = CollisionData()
@@ -35,69 +44,118 @@ def __CircleCircle(c1, r1, c2, r2):
     return (c2 - c1).LengthSq() <= (r1 + r2) * (r1 + r2)
 
 def CircleAABB(center, radius, topleft, bottomright):
-    cData = CollisionData()
-    topright = Vector2(bottomright.x, topleft.y)
-    bottomleft = Vector2(topleft.x, bottomright.y)
+    # Scalars only, a Vector2 is built for the contact point of a hit and nothing else
+    cx, cy = center.x, center.y
+    left, top, right, bottom = topleft.x, topleft.y, bottomright.x, bottomright.y
     # Expanded Square
-    etopleft = topleft - Vector2(radius, radius)
-    ebottomright = bottomright + Vector2(radius, radius)
-    #etopright = topright + Vector2(radius, -radius)
-    #ebottomleft = bottomleft + Vector2(-radius, radius)
-    
-    if not PointAABB(center, etopleft, ebottomright):
-        cData.hit = False
-    else:
-        # Left side
-        if center.x <= topleft.x:
-            # Left Top
-            if center.y <= topleft.y:
-                cData.hit = __PointCircle(center, topleft, radius)
-                cData.contactPoint = topleft
-            # Left Bottom
-            elif center.y >= bottomright.y:
-                cData.hit = __PointCircle(center, bottomleft, radius)
-                cData.contactPoint = bottomleft
-            # Left
-            else:
-                cData.hit = True
-                cData.contactPoint = Vector2(topleft.x, center.y)
-        # Right side
-        elif center.x >= bottomright.x:
-            # Right Top
-            if center.y <= topleft.y:
-                cData.hit = __PointCircle(center, topright, radius)
-                cData.contactPoint = topright
-            # Right Bottom
-            elif center.y >= bottomright.y:
-                cData.hit = __PointCircle(center, bottomright, radius)
-                cData.contactPoint = bottomright
-            # Right
-            else:
-                cData.hit = True
-                cData.contactPoint = Vector2(bottomright.x, center.y)
-        # Top side
-        elif center.y <= topleft.y:
-            cData.hit = True
-            cData.contactPoint = Vector2(center.x, topleft.y)
-        # Bottom side
-        elif center.y >= bottomright.y:
-            cData.hit = True
-            cData.contactPoint = Vector2(center.x, bottomright.y)
-        # Inside
-        else:
-            cData.hit = True
-            # Find closest point to aabb boundary
-            points = [topleft, topright, bottomright, bottomleft]
-            distance = [(topleft-center).LengthSq(), (topright-center).LengthSq(),
-                        (bottomright-center).LengthSq(), (bottomleft-center).LengthSq()]
-            index_min = min(range(len(distance)), key=distance.__getitem__)
-            direction_vector = points[index_min] - center
-            # Check if it's closer to horizontal or vertical
-            if abs(direction_vector.x) < abs(direction_vector.y):
-                cData.contactPoint.x = points[index_min].x
-                cData.contactPoint.y = center.y
-            else:
-                cData.contactPoint.x = center.x
-                cData.contactPoint.y = points[index_min].y
+    if (cx <= left - radius or cy <= top - radius or
+        cx >= right + radius or cy >= bottom + radius):
+        return NO_COLLISION
+    rr = radius * radius
+    # Left side
+    if cx <= left:
+        # Left Top
+        if cy <= top:
+            hit = (left - cx) ** 2 + (top - cy) ** 2 <= rr
+            return CollisionData(hit, Vector2(left, top))
+        # Left Bottom
+        elif cy >= bottom:
+            hit = (left - cx) ** 2 + (bottom - cy) ** 2 <= rr
+            return CollisionData(hit, Vector2(left, bottom))
+        # Left
+        return CollisionData(True, Vector2(left, cy))
+    # Right side
+    elif cx >= right:
+        # Right Top
+        if cy <= top:
+            hit = (right - cx) ** 2 + (top - cy) ** 2 <= rr
+            return CollisionData(hit, Vector2(right, top))
+        # Right Bottom
+        elif cy >= bottom:
+            hit = (right - cx) ** 2 + (bottom - cy) ** 2 <= rr
+            return CollisionData(hit, Vector2(right, bottom))
+        # Right
+        return CollisionData(True, Vector2(right, cy))
+    # Top side
+    elif cy <= top:
+        return CollisionData(True, Vector2(cx, top))
+    # Bottom side
+    elif cy >= bottom:
+        return CollisionData(True, Vector2(cx, bottom))
+    # Inside, find closest corner (topleft, topright, bottomright, bottomleft, first wins a tie)
+    cornerX, cornerY = left, top
+    best = (left - cx) ** 2 + (top - cy) ** 2
+    for px, py in ((right, top), (right, bottom), (left, bottom)):
+        distance = (px - cx) ** 2 + (py - cy) ** 2
+        if distance < best:
+            best, cornerX, cornerY = distance, px, py
+    # Check if it's closer to horizontal or vertical
+    if abs(cornerX - cx) < abs(cornerY - cy):
+        return CollisionData(True, Vector2(cornerX, cy))
+    return CollisionData(True, Vector2(cx, cornerY))
+
+# Time of impact of a circle moving by (dx, dy) against a box, as a fraction of the move in [0, 1], None when it misses
+# Slab test against the box grown by the radius, corners count as square so it can report a hit slightly early
+def SweepCircleAABB(center, radius, dx, dy, topleft, bottomright):
+    tmin, tmax = 0.0, 1.0
+    for origin, delta, low, high in ((center.x, dx, topleft.x - radius, bottomright.x + radius),
+                                     (center.y, dy, topleft.y - radius, bottomright.y + radius)):
+        if delta == 0:
+            if origin <= low or origin >= high:
+                return None
+            continue
+        t1, t2 = (low - origin) / delta, (high - origin) / delta
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > tmin:
+            tmin = t1
+        if t2 < tmax:
+            tmax = t2
+        if tmin > tmax:
+            return None
+    return tmin
+
+# Batched CircleAABB, same rules as CircleAABB (needs numpy)
+# centers: (M, 2), radii: scalar or (M,), boxes: (N, 4) as left, top, right, bottom
+# Returns hits (M, N) bool and contactPoints (M, N, 2). Misses outside the expanded box get (0, 0)
+# and corner misses keep the corner, like the scalar version.
+def CircleAABBBatch(centers, radii, boxes):
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    radii = np.broadcast_to(np.asarray(radii, dtype=np.float64), (centers.shape[0],))
+    cx, cy, r = centers[:, 0, None], centers[:, 1, None], radii[:, None]
+    left, top, right, bottom = boxes[None, :, 0], boxes[None, :, 1], boxes[None, :, 2], boxes[None, :, 3]
+
+    inExpanded = ~((cx <= left - r) | (cy <= top - r) | (cx >= right + r) | (cy >= bottom + r))
+    leftSide = cx <= left
+    rightSide = ~leftSide & (cx >= right)
+    above = cy <= top
+    below = ~above & (cy >= bottom)
+    sideX = leftSide | rightSide
+    sideY = above | below
+    shape = inExpanded.shape
+
+    # Corners, hit when the corner is inside the circle
+    cornerX = np.where(leftSide, left, right)
+    cornerY = np.where(above, top, bottom)
+    cornerHit = (cornerX - cx) ** 2 + (cornerY - cy) ** 2 <= r * r
+    # Sides, contact is the center projected on the edge
+    contactX = np.where(sideX, cornerX, np.broadcast_to(cx, shape))
+    contactY = np.where(sideY, cornerY, np.broadcast_to(cy, shape))
+
+    # Inside, closest corner (topleft, topright, bottomright, bottomleft, first wins a tie)
+    inside = ~sideX & ~sideY
+    if inside.any():
+        cornersX = np.stack(np.broadcast_arrays(left, right, right, left))
+        cornersY = np.stack(np.broadcast_arrays(top, top, bottom, bottom))
+        distance = (cornersX - cx) ** 2 + (cornersY - cy) ** 2
+        closest = np.argmin(distance, axis=0)[None]
+        nearX = np.take_along_axis(cornersX, closest, axis=0)[0]
+        nearY = np.take_along_axis(cornersY, closest, axis=0)[0]
+        horizontal = np.abs(nearX - cx) < np.abs(nearY - cy)
+        contactX = np.where(inside & horizontal, nearX, contactX)
+        contactY = np.where(inside & ~horizontal, nearY, contactY)
 
-    return cData
\ No newline at end of file
+    hits = inExpanded & np.where(sideX & sideY, cornerHit, True)
+    contactPoints = np.stack((np.where(inExpanded, contactX, 0.0), np.where(inExpanded, contactY, 0.0)), axis=-1)
+    return hits, contactPoints
@@ -1,6 +1,8 @@
 import math
 
 class Vector2:
+    __slots__ = ("x", "y")
+
     def __init__(self, x = 0.0, y = 0.0):
         self.x = x
         self.y = y
@@ -12,6 +14,20 @@ class Vector2:
     def toTuple(self):
         return (self.x, self.y)
 
+    def Set(self, x, y):
+        self.x = x
+        self.y = y
+        return self
+
+    def Copy(self):
+        return Vector2(self.x, self.y)
+
+    # self += other * scale, without the temporaries
+    def AddScaled(self, other, scale : float):
+        self.x += other.x * scale
+        self.y += other.y * scale
+        return self
+
     def Normalize(self):
         len = self.Length()
         self.x = self.x / len
@@ -61,6 +77,27 @@ class Vector2:
         y = self.y / other
         return Vector2(x, y)
 
+    # In place, mutates the vector so watch out for shared references
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        return self
+
+    def __imul__(self, other: float):
+        self.x *= other
+        self.y *= other
+        return self
+
+    def __itruediv__(self, other: float):
+        self.x /= other
+        self.y /= other
+        return self
+
     def __eq__(self, other):
         if other != None:
             return (self.x == other.x and self.y == other.y)
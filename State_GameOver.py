@@ -15,6 +15,8 @@ class State_GameOver(BaseState):
     def __init__(self, sm: StateManager, rm: ResourceManager, window: pygame.Surface):
         super().__init__(sm, rm, window, State_GameOver.statename)
         self.backgroundColor = (100, 180, 220)
+        self.dirtyRectMode = True # Mostly static screen
+        self.staticFrame = True # Only redraw on input
         self.levelMap = LevelMap(64)  # GridSize = 64x64
         self.high_score_file = "highscore.txt"  # Path to store the high score
         self.fastest_time_file = "fastest_time.txt"  # Path to store the fastest time
@@ -22,15 +24,14 @@ class State_GameOver(BaseState):
         self.fastest_time = None  # Initialize fastest time
 
     def __drawMap(self):
-        Tiles = LevelMap.Tiles
         dimension = self.levelMap.mapDim
         map = self.levelMap.map
-        for x in range(dimension[0]):
-            for y in range(dimension[1]):
-                value = map[y * dimension[0] + x]
+        for y in range(dimension[1]):
+            row = y * dimension[0]
+            for x in range(dimension[0]):
+                value = map[row + x]
                 if value != 0:
-                    position = Vector2(x * 64, y * 64)
-                    self.AddDrawSprite(Tiles[value], position)
+                    self.AddDrawTile(value, Vector2(x * 64, y * 64))
 
     def __handleKeyInput(self):
         for env in self.eventlist:
@@ -60,8 +61,8 @@ class State_GameOver(BaseState):
 
     def Load(self):
         super().Load()
-        self.levelMap.LoadMap(os.path.join("Assets", "Level", 'GameOverScreen.dat'))
-        self.rm.GetAudioClip("MainMenuBGM").source.play(loops=-1)
+        self.levelMap = self.rm.levelCache.Get(os.path.join("Assets", "Level", 'GameOverScreen.dat'))
+        self.rm.music.Play("MainMenuBGM")
 
         # Load the high score from the file
         if os.path.exists(self.high_score_file):
@@ -98,12 +99,10 @@ class State_GameOver(BaseState):
                 with open(self.fastest_time_file, "w") as file:
                     file.write(f"{self.fastest_time:.2f}")
 
-    def Unload(self):
-        super().Unload()
-        self.rm.GetAudioClip("MainMenuBGM").source.stop()
-
     def Update(self, dt):
         self.__handleKeyInput()
+        if not self.NeedsRedraw((self.high_score, self.fastest_time)):
+            return
         self.__drawMap()
         self.__drawUIs()
         super().Update(dt)
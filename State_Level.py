@@ -1,13 +1,17 @@
 from pygame.constants import K_DOWN, K_F1, K_F2, K_a, K_d, K_SPACE, K_p
 from Engine.BaseState import BaseState
+from Engine.ChunkedTileLayer import ChunkedTileLayer
 from Engine.LevelMap import LevelMap
 from Engine.DebugLog import Debug
+from Engine.EntityStore import EntityStore
+from Engine.Profiler import Profiler
 from Engine.ResourceManager import ResourceManager
 from Engine.StateManager import StateManager
 from Engine.Vector2 import Vector2
 from Engine.Utilities import MYCOLOR
 import Engine.Utilities
 import pygame
+import math
 import os
 
 from State_MainMenu import State_MainMenu
@@ -20,8 +24,19 @@ class Camera:
         self.boundary = (Vector2(), Vector2())
     
     def isWithinView(self, pos):
-        buffer = Vector2(self.bufferSize, self.bufferSize)
-        return Engine.Utilities.PointAABB(pos, self.position - buffer, self.position + self.size + buffer)
+        buffer = self.bufferSize
+        return (self.position.x - buffer < pos.x < self.position.x + self.size.x + buffer and
+                self.position.y - buffer < pos.y < self.position.y + self.size.y + buffer)
+
+    # Range of grid cells overlapping the view (plus buffer) as (x0, y0, x1, y1), end exclusive
+    def GetVisibleTileRange(self, tileSize, mapDim, buffer = None):
+        if buffer == None:
+            buffer = self.bufferSize
+        x0 = max(int((self.position.x - buffer) // tileSize), 0)
+        y0 = max(int((self.position.y - buffer) // tileSize), 0)
+        x1 = min(int((self.position.x + self.size.x + buffer) // tileSize) + 1, mapDim[0])
+        y1 = min(int((self.position.y + self.size.y + buffer) // tileSize) + 1, mapDim[1])
+        return (x0, y0, x1, y1)
 
     def clampToBoundary(self):
         if self.position.x < self.boundary[0].x: self.position.x = self.boundary[0].x
@@ -32,7 +47,10 @@ class Camera:
 class Player:
     def __init__(self):
         self.position = Vector2(0, 0)
+        self.prevPosition = Vector2(0, 0) # position at the start of the last simulation step
         self.velocity = Vector2(0, 0)
+        self.entity = 0 # row in State_Level.entities
+        self.center = Vector2(32, 32)
         self.radius = 28
         self.lives = 3
         self.coins = 0
@@ -60,30 +78,55 @@ class Player:
     
     def Died(self, respawnpt : Vector2):
         self.position = respawnpt
+        self.SnapPrevious()
         self.velocity.SetZero()
         self.lives -= 1
 
+    # Teleported, don't interpolate from the old position
+    def SnapPrevious(self):
+        self.prevPosition.Set(self.position.x, self.position.y)
+
+    def GetRenderPosition(self, alpha, out : Vector2):
+        return out.Set(self.prevPosition.x + (self.position.x - self.prevPosition.x) * alpha,
+                       self.prevPosition.y + (self.position.y - self.prevPosition.y) * alpha)
+
     def isDead(self):
         return self.lives < 0
 
     def colliderData(self):
-        return (self.position + Vector2(32,32), self.radius)
+        # Snapshot of the circle center, reused between calls
+        return (self.center.Set(self.position.x + 32, self.position.y + 32), self.radius)
 
 class State_Level(BaseState):
     statename = "Levels"
+    BATCH_MIN_TRIGGERS = 32 # below this many candidates the scalar test is cheaper than numpy
 
     def __init__(self, sm : StateManager, rm : ResourceManager, window : pygame.Surface):
         super().__init__(sm, rm, window, State_Level.statename)
         self.backgroundColor = (100, 180, 220)
-        self.gravity = 9.8
+        self.moveAcceleration = 66.0 # horizontal speed gained per second while A/D is held
+
+        # Fixed timestep simulation, rendering interpolates between the last two steps
+        self.simRate = 120 # Hz
+        self.maxSimSteps = 8 # per frame, the rest of a long stall is dropped
+        # Sub-step moves longer than the player's radius that would hit a wall, so low sim rates can't tunnel
+        self.continuousCollision = True
+        self.accumulator = 0.0
+        self.renderPosition = Vector2()
 
         self.showDebug = False
         self.camera = Camera(Vector2.fromTuple(window.get_size()))
         
         self.player = Player()
+        # Every moving body of the level, gravity / friction / integration run over all of them at once
+        self.entities = EntityStore()
         self.isOnGround = False
 
         self.levelMap = LevelMap(64) # GridSize = 64x64
+        self.levelPath = None # of levelMap, None until the first level is taken from the cache
+        self.tileLayer = ChunkedTileLayer(rm, 8) # 8x8 tiles per chunk
+        self.triggerHandlers = {} # trigger kind -> (handler, profiler section)
+        self.__registerTriggerHandlers()
         self.numOfLevels = 4
         self.currentLevel = 1
 
@@ -92,16 +135,9 @@ class State_Level(BaseState):
         self.selectedChoice = 0  
             
     def __drawMap(self):
-        Tiles = LevelMap.Tiles
-        dimension = self.levelMap.mapDim
-        map = self.levelMap.map
-        for x in range(dimension[0]):
-            for y in range(dimension[1]):
-                value = map[y * dimension[0] + x]
-                if value != 0:
-                    position = Vector2(x * 64, y * 64)
-                    if self.camera.isWithinView(position):
-                        self.AddDrawSprite(Tiles[value], position - self.camera.position)
+        self.tileLayer.Refresh()
+        chunkRange = self.camera.GetVisibleTileRange(self.tileLayer.GetChunkPixelSize(), self.tileLayer.chunkDim, 0)
+        self.tileLayer.Draw(self, self.camera.position, chunkRange)
         # Draw level ?-?
         self.AddDrawFont(f'Level {self.currentLevel} / 4', 
                         self.levelMap.GetStartPoint_ScreenPos() - Vector2(0, 64) - self.camera.position, 
@@ -152,97 +188,167 @@ class State_Level(BaseState):
     def __handleCollision(self):
         player_collider = self.player.colliderData()
         
-        for collider in self.levelMap.colliders:
-            collision = Engine.Utilities.CircleAABB(player_collider[0], player_collider[1], collider.position, collider.position + collider.size)
+        center, radius = player_collider
+        for collider in self.levelMap.colliderGrid.Query(center, radius):
+            collision = Engine.Utilities.CircleAABB(center, radius, collider.position, collider.bottomright)
             if collision.hit:
-                
-                resolve_dir = (player_collider[0] - collision.contactPoint).Normalized()
-                resolve_dist = self.player.radius - (player_collider[0] - collision.contactPoint).Length()
-                self.player.position += resolve_dir * resolve_dist
-
-                if resolve_dir.y <= -0.7:
+                # Push out along contact -> center, in scalars to skip the temporary vectors
+                dx = center.x - collision.contactPoint.x
+                dy = center.y - collision.contactPoint.y
+                length = math.sqrt(dx ** 2 + dy ** 2)
+                resolve_dirX, resolve_dirY = dx / length, dy / length
+                resolve_dist = self.player.radius - length
+                self.player.position.x += resolve_dirX * resolve_dist
+                self.player.position.y += resolve_dirY * resolve_dist
+
+                if resolve_dirY <= -0.7:
                     self.player.velocity.y = 0
                     self.isOnGround = True
-                if resolve_dir.y >= 0.7:
+                if resolve_dirY >= 0.7:
                     self.player.velocity.y = 0
 
                 
                 if self.showDebug:
                     self.AddDrawDebugPointCall(collision.contactPoint - self.camera.position, MYCOLOR.BLUE)
 
+    # Overlap tests only catch a wall the circle still overlaps at the end of the step. A step longer than
+    # the radius can end past the middle of a wall or beyond it, so such steps are swept first and, when they
+    # would hit something, replayed in pieces no longer than the radius with a collision pass after each
+    def __resolveMovement(self, dt):
+        player = self.player
+        start = player.prevPosition
+        dx, dy = player.position.x - start.x, player.position.y - start.y
+        distance = math.sqrt(dx * dx + dy * dy)
+        if not self.continuousCollision or distance <= player.radius or not self.__sweepHitsCollider(start, dx, dy, distance):
+            self.__handleCollision()
+            return
+        steps = math.ceil(distance / player.radius)
+        Profiler.Count("ccdSubsteps", steps)
+        player.position.Set(start.x, start.y)
+        stepScale = 64.0 * dt / steps
+        for i in range(steps):
+            # Velocity is re-read each piece, a landing zeroes it for the rest of the step
+            player.position.AddScaled(player.velocity, stepScale)
+            self.__handleCollision()
+
+    def __sweepHitsCollider(self, start, dx, dy, distance):
+        center = Vector2(start.x + 32, start.y + 32)
+        radius = self.player.radius
+        # Circle around the whole path for the broad phase
+        middle = Vector2(center.x + dx * 0.5, center.y + dy * 0.5)
+        for collider in self.levelMap.colliderGrid.Query(middle, distance * 0.5 + radius):
+            if Engine.Utilities.SweepCircleAABB(center, radius, dx, dy, collider.position, collider.bottomright) != None:
+                return True
+        return False
+
+    # (trigger, hit) for the triggers near the player's circle, in level order. Large candidate sets go through one numpy call
+    def __queryTriggers(self, center, radius):
+        triggers = self.levelMap.triggers
+        indices = self.levelMap.triggerGrid.QueryIndices(center, radius)
+        if self.levelMap.triggerArray is not None and len(indices) >= State_Level.BATCH_MIN_TRIGGERS:
+            hits = Engine.Utilities.CircleAABBBatch(((center.x, center.y),), radius, self.levelMap.triggerArray[indices])[0][0]
+            return [(triggers[index], hit) for index, hit in zip(indices, hits)]
+        return [(triggers[index], None) for index in indices]
+
+    # handler(trigger) -> True when no further triggers should be handled this step
+    def RegisterTriggerHandler(self, kind : int, handler):
+        self.triggerHandlers[kind] = (handler, f'trigger.{LevelMap.Tiles[kind] if 0 <= kind < len(LevelMap.Tiles) else kind}')
+
+    def __registerTriggerHandlers(self):
+        Kinds = LevelMap.TilesToIndexMap
+        self.RegisterTriggerHandler(Kinds["Ring"], self.__onRing)
+        self.RegisterTriggerHandler(Kinds["Checkpoint_NotActive"], self.__onCheckpoint)
+        self.RegisterTriggerHandler(Kinds["JumpBoost"], self.__onJumpBoost)
+        self.RegisterTriggerHandler(Kinds["SpeedBoost"], self.__onSpeedBoost)
+        self.RegisterTriggerHandler(Kinds["Spike"], self.__onSpike)
+        self.RegisterTriggerHandler(Kinds["JumpPad"], self.__onJumpPad)
+        self.RegisterTriggerHandler(Kinds["Endpoint"], self.__onEndpoint)
+
     def __handleTriggers(self):
         player_collider = self.player.colliderData()
-        for trigger in self.levelMap.triggers:
+        handlers = self.triggerHandlers
+        for trigger, hit in self.__queryTriggers(player_collider[0], player_collider[1]):
             if trigger.active:
-                triggered = Engine.Utilities.CircleAABB(player_collider[0], player_collider[1],
-                                                        trigger.position, trigger.position + trigger.size)
-                if triggered.hit:
-                    if trigger.name == "Ring":
-                        self.player.coins += 1
-                        self.player.score += 2
-                        self.levelMap.RemoveRingTrigger(trigger)
-                        self.rm.GetAudioClip("PickupCoin").Play()
-                        trigger.active = False
-                    
-                        if self.player.coins == 20:
-                            self.rm.GetAudioClip("Checkpoint").Play()
-                            self.levelMap.ActivateEndpoint(trigger)
-                    elif trigger.name == "Checkpoint_NotActive":
-                        self.levelMap.ActivateCheckpointTrigger(trigger)
-                        self.rm.GetAudioClip("Checkpoint").Play()
-                        trigger.active = False
-                    elif trigger.name == "JumpBoost":
-                        self.player.isBoosted = True
-                        self.player.jumpForce = self.player.boostedJumpForce
-                        self.levelMap.RemoveRingTrigger(trigger)
-                        self.player.boostTimer = 5.0 
-                        self.rm.GetAudioClip("Boost").Play()
-                        trigger.active = False
-                    elif trigger.name == "SpeedBoost":
-                        self.player.speeder = True
-                        self.player.speed = self.player.boostedspeed
-                        self.levelMap.RemoveRingTrigger(trigger)
-                        self.player.boostTimer = 5.0 
-                        self.rm.GetAudioClip("Boost").Play()
-                        trigger.active = False
-                    elif trigger.name == "Spike":
-                        self.player.Died(self.levelMap.GetRespawnPoint_ScreenPos())
-                        self.rm.GetAudioClip("Hit").Play()
-                        if self.player.isDead():
-                            self.__GameOver()
-                        break
-                    elif trigger.name == "JumpPad":
-                        self.player.velocity.y = -20
-                        self.rm.GetAudioClip("JumpPad").Play()
-                        break
-                    elif trigger.name == "Endpoint":
-                        if self.player.coins < 20:
-                            continue
-                    
-                        trigger.active = False
-                        if self.currentLevel != self.numOfLevels:
-                            self.__LoadLevel(self.currentLevel + 1)
-                            self.player.coins = 0
-                        else:
-                            self.__GameOver()
+                entry = handlers.get(trigger.kind)
+                if entry == None:
+                    continue
+                if hit == None:
+                    hit = Engine.Utilities.CircleAABB(player_collider[0], player_collider[1],
+                                                      trigger.position, trigger.bottomright).hit
+                if hit:
+                    # Section calls are the per-kind hit counts
+                    t = Profiler.Start()
+                    stop = entry[0](trigger)
+                    Profiler.Stop(entry[1], t)
+                    if stop:
                         break
 
-    def __handlePhysics(self, dt: float):
-        # Gravity
-        self.player.velocity.y += self.gravity * dt * 2
-        # Terminal velocity
-        if self.player.velocity.y > 33.0:
-            self.player.velocity.y = 33.0
-
-        # Friction
-        if self.player.velocity.x > 0.3:
-            self.player.velocity.x -= 0.2
-        elif self.player.velocity.x < -0.3:
-            self.player.velocity.x += 0.2
+    def __onRing(self, trigger):
+        self.player.coins += 1
+        self.player.score += 2
+        self.levelMap.RemoveRingTrigger(trigger)
+        self.rm.GetAudioClip("PickupCoin").Play()
+        trigger.active = False
+
+        if self.player.coins == 20:
+            self.rm.GetAudioClip("Checkpoint").Play()
+            self.levelMap.ActivateEndpoint(trigger)
+        return False
+
+    def __onCheckpoint(self, trigger):
+        self.levelMap.ActivateCheckpointTrigger(trigger)
+        self.rm.GetAudioClip("Checkpoint").Play()
+        trigger.active = False
+        return False
+
+    def __onJumpBoost(self, trigger):
+        self.player.isBoosted = True
+        self.player.jumpForce = self.player.boostedJumpForce
+        self.levelMap.RemoveRingTrigger(trigger)
+        self.player.boostTimer = 5.0 
+        self.rm.GetAudioClip("Boost").Play()
+        trigger.active = False
+        return False
+
+    def __onSpeedBoost(self, trigger):
+        self.player.speeder = True
+        self.player.speed = self.player.boostedspeed
+        self.levelMap.RemoveRingTrigger(trigger)
+        self.player.boostTimer = 5.0 
+        self.rm.GetAudioClip("Boost").Play()
+        trigger.active = False
+        return False
+
+    def __onSpike(self, trigger):
+        self.player.Died(self.levelMap.GetRespawnPoint_ScreenPos())
+        self.rm.GetAudioClip("Hit").Play()
+        if self.player.isDead():
+            self.__GameOver()
+        return True
+
+    def __onJumpPad(self, trigger):
+        self.player.velocity.y = -20
+        self.rm.GetAudioClip("JumpPad").Play()
+        return True
+
+    def __onEndpoint(self, trigger):
+        if self.player.coins < 20:
+            return False
+
+        trigger.active = False
+        if self.currentLevel != self.numOfLevels:
+            self.__LoadLevel(self.currentLevel + 1)
+            self.player.coins = 0
         else:
-            self.player.velocity.x = 0.0
+            self.__GameOver()
+        return True
 
-        self.player.position += self.player.velocity * 64.0 * dt
+    def __handlePhysics(self, dt: float):
+        # The player is entity 0, its vectors are copied in and out around the shared pass
+        entities = self.entities
+        entities.SetState(self.player.entity, self.player.position, self.player.velocity)
+        entities.Integrate(dt)
+        entities.GetState(self.player.entity, self.player.position, self.player.velocity)
 
     def __handleKeyInput(self):
         # Trigger once
@@ -287,29 +393,47 @@ class State_Level(BaseState):
                             self.isPaused = False
                             self.showChoices = False
 
+    def __handleMovementInput(self, dt):
         # Repeated call
-        if not self.isPaused:
-            keypress = pygame.key.get_pressed()
-            if keypress[K_a]:
-                if self.player.velocity.x > -self.player.speed:
-                    self.player.velocity.x -= 1.1
-            elif keypress[K_d]:
-                if self.player.velocity.x < self.player.speed:
-                    self.player.velocity.x += 1.1
+        keypress = self.GetPressedKeys()
+        if keypress[K_a]:
+            if self.player.velocity.x > -self.player.speed:
+                self.player.velocity.x -= self.moveAcceleration * dt
+        elif keypress[K_d]:
+            if self.player.velocity.x < self.player.speed:
+                self.player.velocity.x += self.moveAcceleration * dt
 
     def __updateCamera(self):
-        self.camera.position = self.player.position - Vector2(400, 300)
+        self.camera.position.Set(self.renderPosition.x - 400, self.renderPosition.y - 300)
         self.camera.clampToBoundary()
 
+    @staticmethod
+    def __levelPath(level):
+        return os.path.join("Assets", "Level", f'Level{level}.dat')
+
     def __LoadLevel(self, level):
+        t = Profiler.Start()
         self.currentLevel = level
-        self.levelMap.LoadMap(os.path.join("Assets", "Level", f'Level{self.currentLevel}.dat'))
-        self.levelMap.GenerateColliders()
+        # Swap in the prefetched map, and start on the next one while this one is played
+        # The map left behind goes back to the cache, playing it again resets it instead of loading it
+        if self.levelPath != None:
+            self.rm.levelCache.Release(self.levelPath, self.levelMap)
+        self.levelPath = State_Level.__levelPath(level)
+        self.levelMap = self.rm.levelCache.Take(self.levelPath)
+        if level < self.numOfLevels:
+            self.rm.levelCache.Prefetch(State_Level.__levelPath(level + 1))
+        self.tileLayer.Build(self.levelMap)
         # Init camera settings
         self.camera.boundary = (Vector2(), Vector2(self.levelMap.mapDim[0] * 64 - self.camera.size.x,
                                                    self.levelMap.mapDim[1] * 64 - self.camera.size.y))
         # Init player starting position
         self.player.position = self.levelMap.GetStartPoint_ScreenPos() - Vector2(0,64)
+        self.player.SnapPrevious()
+        self.levelMap.StreamAround(self.player.position, self.camera.size)
+        self.entities.Clear()
+        self.player.entity = self.entities.Add(self.player.position, self.player.velocity, self.player.radius)
+        self.accumulator = 0.0
+        Profiler.Stop("loadLevel", t)
 
     def __ResetStats(self):
         self.player.coins = 0
@@ -340,37 +464,60 @@ class State_Level(BaseState):
 
     def Load(self):
         super().Load()
-        self.rm.GetAudioClip("inGameBGM").source.play(loops=-1)
+        self.rm.music.Play("inGameBGM")
         self.__LoadLevel(self.currentLevel)
         self.__ResetStats()
 
-    def Unload(self):
-        super().Unload()
-        self.rm.GetAudioClip("inGameBGM").source.stop()
+    def __stepSimulation(self, dt):
+        self.player.SnapPrevious()
+        # Streamed levels keep colliders / triggers only near the player, also right after a respawn far away
+        self.levelMap.StreamAround(self.player.position, self.camera.size)
+        t = Profiler.Start()
+        self.__handleMovementInput(dt)
+        Profiler.Stop("input", t)
+        t = Profiler.Start()
+        self.__handlePhysics(dt)
+        Profiler.Stop("physics", t)
+        t = Profiler.Start()
+        self.__resolveMovement(dt)
+        Profiler.Stop("collision", t)
+        t = Profiler.Start()
+        self.__handleTriggers()
+        Profiler.Stop("triggers", t)
 
     def Update(self, dt):
         self.sm.variables["TimeTaken"] += dt
-        if dt > 2/60:
-            return
 
+        self.__handleKeyInput()
+        step = 1.0 / self.simRate
         if not self.isPaused:
-            self.__handleKeyInput()
-            self.__handlePhysics(dt)
-            self.__handleCollision()
-            self.__handleTriggers()
-            self.__updateCamera()
-        else:
-            self.__handleKeyInput()
+            self.accumulator += dt
+            steps = 0
+            while self.accumulator >= step and steps < self.maxSimSteps:
+                self.__stepSimulation(step)
+                self.accumulator -= step
+                steps += 1
+                # Game over / main menu, the level is done for this frame
+                if self.sm.IsStateChanged():
+                    break
+            if steps == self.maxSimSteps:
+                # Too far behind, drop the backlog instead of spiralling
+                self.accumulator = min(self.accumulator, step)
         # Update player boost state
         self.player.UpdateBoost(dt)
+        self.player.GetRenderPosition(min(self.accumulator / step, 1.0), self.renderPosition)
 
-        self.__drawMap()
+        t = Profiler.Start()
         self.__updateCamera()
-        self.AddDrawSprite("Ball", self.player.position - self.camera.position)
+        self.__drawMap()
+        self.AddDrawSprite("Ball", self.renderPosition - self.camera.position)
         self.__drawUI()
 
         if self.showDebug:
             self.__drawColliders()
+        Profiler.Stop("queueDraw", t)
 
+        # Nothing scrolls while paused, only push the changed regions
+        self.dirtyRectMode = self.isPaused
         super().Update(dt)
         super().Draw()
\ No newline at end of file
@@ -0,0 +1,27 @@
+from Engine.BaseState import BaseState
+from Engine.ResourceManager import ResourceManager
+from Engine.StateManager import StateManager
+from Engine.Vector2 import Vector2
+from Engine.Utilities import MYCOLOR
+import pygame
+
+# Shown while ResourceManager decodes the assets on its loader threads, then moves on to nextState
+class State_Loading(BaseState):
+    statename = "Loading"
+
+    def __init__(self, sm : StateManager, rm : ResourceManager, window : pygame.Surface):
+        super().__init__(sm, rm, window, State_Loading.statename)
+        self.backgroundColor = (100, 180, 220)
+        self.dirtyRectMode = True # Only the progress text changes
+        self.nextState = "Main Menu"
+
+    def Update(self, dt):
+        # Loads done decoding are converted to the display format here, on the main thread
+        self.rm.FinishLoaded()
+        if not self.rm.IsLoading():
+            self.sm.ChangeState(self.nextState)
+            return
+        loaded, total = self.rm.GetLoadProgress()
+        self.AddDrawUIFont(f'Loading... {loaded} / {total}', Vector2(32, 560), MYCOLOR.WHITE, 40)
+        super().Update(dt)
+        super().Draw()
@@ -40,21 +40,22 @@ class State_MainMenu(BaseState):
     def __init__(self, sm : StateManager, rm : ResourceManager, window : pygame.Surface):
         super().__init__(sm, rm, window, State_MainMenu.statename)
         self.backgroundColor = (100, 180, 220)
+        self.dirtyRectMode = True # Mostly static screen
+        self.staticFrame = True # Only redraw on input
         
         self.options = CycleOptions(0,3)
         self.levelMap = LevelMap(64) # GridSize = 64x64
         self.page = 0 # 0:Menu, 1:Instruction, 2:Credits
     
     def __drawMap(self):
-        Tiles = LevelMap.Tiles
         dimension = self.levelMap.mapDim
         map = self.levelMap.map
-        for x in range(dimension[0]):
-            for y in range(dimension[1]):
-                value = map[y * dimension[0] + x]
+        for y in range(dimension[1]):
+            row = y * dimension[0]
+            for x in range(dimension[0]):
+                value = map[row + x]
                 if value != 0:
-                    position = Vector2(x * 64, y * 64)
-                    self.AddDrawSprite(Tiles[value], position)
+                    self.AddDrawTile(value, Vector2(x * 64, y * 64))
 
     def __handleKeyInput(self):
         # Trigger once
@@ -110,15 +111,13 @@ class State_MainMenu(BaseState):
 
     def Load(self):
         super().Load()
-        self.levelMap.LoadMap(os.path.join("Assets", "Level", 'TitleScreen.dat'))
-        self.rm.GetAudioClip("MainMenuBGM").source.play(loops=-1)
-    
-    def Unload(self):
-        super().Unload()
-        self.rm.GetAudioClip("MainMenuBGM").source.stop()
+        self.levelMap = self.rm.levelCache.Get(os.path.join("Assets", "Level", 'TitleScreen.dat'))
+        self.rm.music.Play("MainMenuBGM")
     
     def Update(self, dt):
         self.__handleKeyInput()
+        if not self.NeedsRedraw((self.page, self.options.currentVal)):
+            return
         # Draw screen
         self.__drawMap()
         self.__drawUIs()
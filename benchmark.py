@@ -0,0 +1,565 @@
+# Benchmarks, results are printed as JSON so revisions can be compared
+# python benchmark.py frames --frames 600 --out frames.json
+# python benchmark.py colliders
+# python benchmark.py vector
+# python benchmark.py collide
+# python benchmark.py entities
+# python benchmark.py ccd
+# python benchmark.py levels
+# python benchmark.py marathon --columns 10000
+# python benchmark.py restart --columns 2000
+# python benchmark.py startup
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Must be set before pygame creates the window
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+import pygame
+import main
+from Engine.AssetCache import AssetCache
+from Engine.EntityStore import EntityStore
+from Engine.LevelMap import LevelMap
+from Engine.Profiler import Profiler
+from Engine.ResourceManager import ResourceManager
+from Engine.StreamedLevelMap import StreamedLevelMap
+from Engine.Vector2 import Vector2
+import Engine.Utilities as Utilities
+from State_Level import State_Level
+
+def GetRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def Percentile(sortedValues, p):
+    if not sortedValues:
+        return 0.0
+    index = min(int(round(p / 100.0 * (len(sortedValues) - 1))), len(sortedValues) - 1)
+    return sortedValues[index]
+
+def SummarizeFrameTimes(frameTimes):
+    ordered = sorted(frameTimes)
+    total = sum(frameTimes)
+    return {"fps" : len(frameTimes) / total if total > 0 else 0.0,
+            "frameTimeMs" : {"mean" : total * 1000.0 / max(len(frameTimes), 1),
+                             "p50" : Percentile(ordered, 50) * 1000.0,
+                             "p95" : Percentile(ordered, 95) * 1000.0,
+                             "p99" : Percentile(ordered, 99) * 1000.0,
+                             "max" : (ordered[-1] if ordered else 0.0) * 1000.0}}
+
+# Same input every run: run right, jump regularly, turn around every third stretch
+def ScriptedInput(frame, keyState):
+    stretch = (frame // 120) % 3
+    keyState[pygame.K_d] = stretch != 2
+    keyState[pygame.K_a] = stretch == 2
+    events = []
+    if frame % 40 == 0:
+        events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE))
+    return events
+
+def Setup():
+    main.CreateWindow(True)
+    main.InitializeResources()
+    main.InitializeStates()
+
+def StartLevel(level : State_Level, levelNumber):
+    sm = main.sm
+    sm.variables["TimeTaken"] = 0
+    sm.currentState = sm.newState = State_Level.statename
+    level.currentLevel = levelNumber
+    level.Load()
+    level.player.lives = 1000000 # Never game over, spikes only respawn
+
+# Scripted frames on one level, stops early if the level is left. onFrame(frame) runs after every frame
+def RunLevelFrames(level : State_Level, levelNumber, frames, dt, onFrame = None):
+    sm = main.sm
+    keyState = {pygame.K_a : False, pygame.K_d : False}
+    level.keyState = keyState
+    StartLevel(level, levelNumber)
+    frameTimes = []
+    for frame in range(frames):
+        events = ScriptedInput(frame, keyState)
+        start = time.perf_counter()
+        sm.UpdateState(events, dt)
+        frameTimes.append(time.perf_counter() - start)
+        if onFrame != None:
+            onFrame(frame)
+        if sm.IsStateChanged() or level.currentLevel != levelNumber:
+            break
+    level.Unload()
+    return frameTimes
+
+def BenchFrames(args):
+    Setup()
+    level : State_Level = main.sm.states[State_Level.statename]
+    results = []
+    allFrameTimes = []
+    for levelNumber in args.levels:
+        Profiler.enabled = True
+        Profiler.Reset()
+        frameTimes = RunLevelFrames(level, levelNumber, args.frames, args.dt)
+        Profiler.enabled = False
+        result = {"level" : levelNumber, "frames" : len(frameTimes)}
+        result.update(SummarizeFrameTimes(frameTimes))
+        result["phases"] = Profiler.Report(len(frameTimes))
+        results.append(result)
+        allFrameTimes += frameTimes
+    report = {"benchmark" : "frames", "revision" : GetRevision(), "python" : platform.python_version(),
+              "pygame" : pygame.version.ver, "dt" : args.dt, "framesPerLevel" : args.frames, "levels" : results}
+    report["total"] = SummarizeFrameTimes(allFrameTimes)
+    return report
+
+# Vector2 objects created per frame, plus the cost of one CircleAABB call
+def BenchVector(args):
+    Setup()
+    level : State_Level = main.sm.states[State_Level.statename]
+    created = [0]
+    vectorInit = Vector2.__init__
+    def CountingInit(self, x = 0.0, y = 0.0):
+        created[0] += 1
+        vectorInit(self, x, y)
+    results = []
+    for levelNumber in args.levels:
+        perFrame = []
+        def OnFrame(frame):
+            perFrame.append(created[0])
+            created[0] = 0
+        Vector2.__init__ = CountingInit
+        try:
+            # Count from the first frame on, not the level load
+            StartLevel(level, levelNumber)
+            level.Unload()
+            created[0] = 0
+            RunLevelFrames(level, levelNumber, args.frames, args.dt, OnFrame)
+        finally:
+            Vector2.__init__ = vectorInit
+        perFrame = perFrame[1:] # first frame includes Load()
+        results.append({"level" : levelNumber, "frames" : len(perFrame),
+                        "vector2PerFrame" : sum(perFrame) / max(len(perFrame), 1),
+                        "vector2MaxPerFrame" : max(perFrame, default=0)})
+
+    # CircleAABB against every wall of Level1 from a fixed spread of centers
+    levelMap = LevelMap(64)
+    levelMap.LoadMap(os.path.join("Assets", "Level", "Level1.dat"))
+    levelMap.GenerateColliders()
+    centers = [Vector2(x * 37.0 % (levelMap.mapDim[0] * 64), y * 53.0 % (levelMap.mapDim[1] * 64))
+               for x in range(40) for y in range(25)]
+    boxes = [(collider.position, collider.position + collider.size) for collider in levelMap.colliders]
+    calls = len(centers) * len(boxes)
+    start = time.perf_counter()
+    for center in centers:
+        for topleft, bottomright in boxes:
+            Utilities.CircleAABB(center, 28, topleft, bottomright)
+    elapsed = time.perf_counter() - start
+    return {"benchmark" : "vector", "revision" : GetRevision(), "levels" : results,
+            "circleAABB" : {"calls" : calls, "nsPerCall" : elapsed * 1e9 / calls}}
+
+# Every center of a grid spread over Level4 against every wall, scalar CircleAABB versus one CircleAABBBatch call
+def BenchCollide(args):
+    if Utilities.np == None:
+        return {"benchmark" : "collide", "revision" : GetRevision(), "error" : "numpy is not installed"}
+    np = Utilities.np
+    levelMap = LevelMap(64)
+    levelMap.LoadMap(os.path.join("Assets", "Level", "Level4.dat"))
+    levelMap.GenerateColliders()
+    width, height = levelMap.mapDim[0] * 64, levelMap.mapDim[1] * 64
+    step = max(int((width * height / args.centers) ** 0.5), 1)
+    centers = [Vector2(float(x), float(y)) for y in range(0, height, step) for x in range(0, width, step)]
+    colliders = levelMap.colliders
+    pairs = len(centers) * len(colliders)
+
+    start = time.perf_counter()
+    scalar = [[Utilities.CircleAABB(center, args.radius, collider.position, collider.bottomright) for collider in colliders]
+              for center in centers]
+    scalarTime = time.perf_counter() - start
+    start = time.perf_counter()
+    hits, contactPoints = Utilities.CircleAABBBatch([(center.x, center.y) for center in centers], args.radius,
+                                                    levelMap.colliderArray)
+    batchTime = time.perf_counter() - start
+
+    mismatches = 0
+    for i, row in enumerate(scalar):
+        for j, collision in enumerate(row):
+            if collision.hit != hits[i, j] or (collision.hit and (collision.contactPoint.x != contactPoints[i, j, 0] or
+                                                                  collision.contactPoint.y != contactPoints[i, j, 1])):
+                mismatches += 1
+    return {"benchmark" : "collide", "revision" : GetRevision(), "numpy" : np.__version__,
+            "centers" : len(centers), "colliders" : len(colliders), "pairs" : pairs, "mismatches" : mismatches,
+            "scalarNsPerPair" : scalarTime * 1e9 / pairs, "batchNsPerPair" : batchTime * 1e9 / pairs,
+            "speedup" : scalarTime / batchTime if batchTime > 0 else 0.0}
+
+# Scripted play at several sim rates with continuous collision off and on, counting frames that end
+# with the ball's center inside a wall or below the map, i.e. it tunneled
+def BenchCCD(args):
+    Setup()
+    level : State_Level = main.sm.states[State_Level.statename]
+    simRate, continuousCollision = level.simRate, level.continuousCollision
+    results = []
+    try:
+        for rate in args.rates:
+            for ccd in (False, True):
+                level.simRate, level.continuousCollision = rate, ccd
+                tunneled = [0]
+                def OnFrame(frame):
+                    center = level.player.colliderData()[0]
+                    if center.y > level.levelMap.mapDim[1] * level.levelMap.gridsize or any(
+                        Utilities.PointAABB(center, collider.position, collider.bottomright) for collider in level.levelMap.colliders):
+                        tunneled[0] += 1
+                Profiler.enabled = True
+                Profiler.Reset()
+                frameTimes = []
+                for levelNumber in args.levels:
+                    frameTimes += RunLevelFrames(level, levelNumber, args.frames, args.dt, OnFrame)
+                Profiler.enabled = False
+                results.append({"simRate" : rate, "continuousCollision" : ccd, "frames" : len(frameTimes),
+                                "tunneledFrames" : tunneled[0],
+                                "substeps" : Profiler.counters.get("ccdSubsteps", 0),
+                                "frameTimeMs" : SummarizeFrameTimes(frameTimes)["frameTimeMs"]["mean"]})
+    finally:
+        level.simRate, level.continuousCollision = simRate, continuousCollision
+    return {"benchmark" : "ccd", "revision" : GetRevision(), "dt" : args.dt, "framesPerLevel" : args.frames, "runs" : results}
+
+def FillEntityStore(count):
+    store = EntityStore()
+    for i in range(count):
+        # Spread out, half moving left, half right, some falling fast enough to hit terminal velocity
+        store.Add(Vector2(i * 37.0 % 5000, i * 53.0 % 3000), Vector2((i % 7 - 3) * 1.5, (i % 11) * 4.0 - 20), 28)
+    return store
+
+# EntityStore.Integrate() cost from 1 to 1000 bodies, plain loop versus numpy pass
+def BenchEntities(args):
+    results = []
+    vectorizeMin = EntityStore.VECTORIZE_MIN
+    try:
+        for count in args.counts:
+            result = {"bodies" : count}
+            paths = [("loop", 1 << 62)] + ([("vectorized", 0)] if Utilities.np != None else [])
+            stores = {}
+            for path, threshold in paths:
+                EntityStore.VECTORIZE_MIN = threshold
+                store = stores[path] = FillEntityStore(count)
+                start = time.perf_counter()
+                for step in range(args.steps):
+                    store.Integrate(args.dt)
+                elapsed = time.perf_counter() - start
+                result[path] = {"usPerStep" : elapsed * 1e6 / args.steps,
+                                "nsPerBody" : elapsed * 1e9 / (args.steps * count)}
+            if "vectorized" in stores:
+                result["match"] = all(list(getattr(stores["loop"], column)) == list(getattr(stores["vectorized"], column))
+                                      for column in ("posX", "posY", "velX", "velY"))
+            results.append(result)
+    finally:
+        EntityStore.VECTORIZE_MIN = vectorizeMin
+    return {"benchmark" : "entities", "revision" : GetRevision(), "numpy" : Utilities.np != None,
+            "vectorizeMin" : vectorizeMin, "steps" : args.steps, "dt" : args.dt, "counts" : results}
+
+# Wall collider count of the old merge: a horizontal run, or a vertical run when the row run is a single tile
+def CountStripColliders(levelMap : LevelMap):
+    width, height = levelMap.mapDim
+    mymap = levelMap.map[:]
+    count = 0
+    for y in range(height):
+        for x in range(width):
+            if mymap[y * width + x] != 1:
+                continue
+            run = 1
+            while x + run < width and mymap[y * width + x + run] == 1:
+                mymap[y * width + x + run] = 0
+                run += 1
+            if run == 1:
+                j = y + 1
+                while j < height and mymap[j * width + x] == 1:
+                    mymap[j * width + x] = 0
+                    j += 1
+            count += 1
+    return count
+
+def LevelPaths():
+    folder = os.path.join("Assets", "Level")
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith(".dat")]
+
+# Level load time, parsing the .dat and generating colliders versus reading the compiled file
+def BenchLevels(args):
+    results = []
+    compiledDir = LevelMap.compiledDir
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            LevelMap.compiledDir = folder
+            for path in LevelPaths():
+                parseTimes, compiledTimes = [], []
+                for i in range(args.repeat):
+                    levelMap = LevelMap(64)
+                    start = time.perf_counter()
+                    levelMap.LoadMap(path)
+                    levelMap.GenerateColliders()
+                    parseTimes.append(time.perf_counter() - start)
+                # First Load() compiles, the rest read the compiled file
+                LevelMap(64).Load(path)
+                for i in range(args.repeat):
+                    levelMap = LevelMap(64)
+                    start = time.perf_counter()
+                    levelMap.Load(path)
+                    compiledTimes.append(time.perf_counter() - start)
+                parseMs = Percentile(sorted(parseTimes), 50) * 1000.0
+                compiledMs = Percentile(sorted(compiledTimes), 50) * 1000.0
+                results.append({"level" : os.path.basename(path), "sourceBytes" : os.path.getsize(path),
+                                "compiledBytes" : os.path.getsize(LevelMap.GetCompiledPath(path)),
+                                "parseMs" : parseMs, "compiledMs" : compiledMs,
+                                "speedup" : parseMs / compiledMs if compiledMs > 0 else 0.0})
+    finally:
+        LevelMap.compiledDir = compiledDir
+    return {"benchmark" : "levels", "revision" : GetRevision(), "repeat" : args.repeat, "levels" : results}
+
+# Level1 repeated side by side until it is at least columns wide, one start at the left and one end at the right
+def WriteMarathonLevel(path, columns):
+    with open(os.path.join("Assets", "Level", "Level1.dat"), "r") as f:
+        rows = [[int(value, 10) for value in line.split(',')] for line in f if line.strip()]
+    copies = -(-columns // len(rows[0]))
+    Start, End = LevelMap.TilesToIndexMap["Startpoint"], LevelMap.TilesToIndexMap["Endpoint"]
+    with open(path, "w") as f:
+        for y, row in enumerate(rows):
+            line = []
+            for copy in range(copies):
+                line += [0 if (value == Start and copy > 0) or (value == End and copy < copies - 1) else value for value in row]
+            f.write(",".join(str(value) for value in line) + ("\n" if y < len(rows) - 1 else ""))
+
+# Runs function twice, timed without tracing and then under tracemalloc. Returns result, ms, held bytes, peak bytes
+def MeasureRun(function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed * 1000.0, current, peak
+
+# Whole map load versus streaming a marathon level, then a camera sweep from one end to the other
+def BenchMarathon(args):
+    compiledDir = LevelMap.compiledDir
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            LevelMap.compiledDir = folder
+            path = os.path.join(folder, "Marathon.dat")
+            WriteMarathonLevel(path, args.columns)
+
+            def LoadWhole():
+                levelMap = LevelMap(64)
+                levelMap.LoadMap(path)
+                levelMap.GenerateColliders()
+                return levelMap
+            levelMap, wholeMs, wholeBytes, wholePeak = MeasureRun(LoadWhole)
+            width, height = levelMap.mapDim
+            colliders = len(levelMap.colliders) + len(levelMap.triggers)
+            del levelMap
+
+            start = time.perf_counter()
+            StreamedLevelMap(64).Load(path) # converts the .dat once
+            convertMs = (time.perf_counter() - start) * 1000.0
+            def Sweep():
+                streamed = StreamedLevelMap(64)
+                streamed.Load(path)
+                extent = Vector2(960, 640)
+                stepTimes = []
+                for x in range(0, width * 64, args.step):
+                    start = time.perf_counter()
+                    streamed.StreamAround(Vector2(x, height * 32), extent)
+                    stepTimes.append(time.perf_counter() - start)
+                return streamed, stepTimes
+            start = time.perf_counter()
+            streamed, stepTimes = Sweep()
+            sweepMs = (time.perf_counter() - start) * 1000.0
+            stepTimes.sort()
+            streamedBytes, streamedPeak = MeasureRun(Sweep)[2:]
+            return {"benchmark" : "marathon", "revision" : GetRevision(), "columns" : width, "rows" : height,
+                    "sourceBytes" : os.path.getsize(path),
+                    "whole" : {"loadMs" : wholeMs, "heapBytes" : wholeBytes, "peakHeapBytes" : wholePeak, "boxes" : colliders},
+                    "streamed" : {"convertMs" : convertMs, "sweepMs" : sweepMs, "heapBytes" : streamedBytes,
+                                  "peakHeapBytes" : streamedPeak, "residentChunks" : len(streamed.chunks),
+                                  "residentBoxes" : len(streamed.colliders) + len(streamed.triggers),
+                                  "stepMs" : {"p50" : Percentile(stepTimes, 50) * 1000.0, "p99" : Percentile(stepTimes, 99) * 1000.0,
+                                              "max" : stepTimes[-1] * 1000.0},
+                                  "stats" : streamed.streamStats}}
+    finally:
+        LevelMap.compiledDir = compiledDir
+
+# Restarting a large level: loading it again versus LevelMap.Reset() after part of it was played
+def BenchRestart(args):
+    compiledDir = LevelMap.compiledDir
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            LevelMap.compiledDir = folder
+            path = os.path.join(folder, "Restart.dat")
+            WriteMarathonLevel(path, args.columns)
+            LevelMap(64).Load(path) # compiles
+            loadTimes, compiledTimes = [], []
+            for i in range(args.repeat):
+                levelMap = LevelMap(64)
+                start = time.perf_counter()
+                levelMap.LoadMap(path)
+                levelMap.GenerateColliders()
+                loadTimes.append(time.perf_counter() - start)
+                levelMap = LevelMap(64)
+                start = time.perf_counter()
+                levelMap.Load(path)
+                compiledTimes.append(time.perf_counter() - start)
+
+            consumable = [trigger for trigger in levelMap.triggers if trigger.kind in StreamedLevelMap.CONSUMABLE]
+            results = []
+            for fraction in args.played:
+                played = consumable[:int(len(consumable) * fraction)]
+                resetTimes = []
+                for i in range(args.repeat):
+                    # Same writes as the trigger handlers of State_Level
+                    for trigger in played:
+                        if trigger.kind == LevelMap.TilesToIndexMap["Checkpoint_NotActive"]:
+                            levelMap.ActivateCheckpointTrigger(trigger)
+                        else:
+                            levelMap.RemoveRingTrigger(trigger)
+                        trigger.active = False
+                    if fraction == 1.0:
+                        levelMap.ActivateEndpoint(played[-1])
+                    start = time.perf_counter()
+                    levelMap.Reset()
+                    resetTimes.append(time.perf_counter() - start)
+                    levelMap.dirtyTiles.clear()
+                results.append({"played" : fraction, "usedTriggers" : len(played), "resetMs" : Percentile(sorted(resetTimes), 50) * 1000.0})
+            return {"benchmark" : "restart", "revision" : GetRevision(), "columns" : levelMap.mapDim[0], "rows" : levelMap.mapDim[1],
+                    "repeat" : args.repeat, "triggers" : len(levelMap.triggers),
+                    "loadMs" : Percentile(sorted(loadTimes), 50) * 1000.0,
+                    "compiledLoadMs" : Percentile(sorted(compiledTimes), 50) * 1000.0, "reset" : results}
+    finally:
+        LevelMap.compiledDir = compiledDir
+
+# Asset loading of a launch: decoding every file, with an empty asset cache (cold) and a filled one (warm)
+def BenchStartup(args):
+    main.CreateWindow(True) # Converting to the display format needs a window
+    atlasNames = LevelMap.Tiles + ["Ball", "Black", "Title"]
+    def Launch(cacheDir):
+        rm = ResourceManager()
+        if cacheDir != None:
+            rm.assetCache = AssetCache(os.path.join(cacheDir, "Assets"))
+        start = time.perf_counter()
+        rm.LoadTextureAtlasAsync(main.TEXTURES, atlasNames, cacheDir)
+        rm.LoadAudioClipsAsync(main.AUDIO_CLIPS)
+        submitted = time.perf_counter()
+        # What State_Loading does every frame, until nothing is left
+        while rm.IsLoading():
+            rm.FinishLoaded()
+            time.sleep(0.0005)
+        ready = time.perf_counter()
+        stats = rm.assetCache.GetStats() if rm.assetCache != None else None
+        rm.Shutdown()
+        return (submitted - start) * 1000.0, (ready - start) * 1000.0, stats
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        runs = {"uncached" : [], "cold" : [], "warm" : []}
+        for i in range(args.repeat):
+            runs["uncached"].append(Launch(None))
+            cacheDir = os.path.join(folder, f'cold{i}')
+            runs["cold"].append(Launch(cacheDir))
+            runs["warm"].append(Launch(cacheDir))
+        for mode, launches in runs.items():
+            results[mode] = {"submitMs" : Percentile(sorted(launch[0] for launch in launches), 50),
+                             "readyMs" : Percentile(sorted(launch[1] for launch in launches), 50),
+                             "cache" : launches[-1][2]}
+    return {"benchmark" : "startup", "revision" : GetRevision(), "repeat" : args.repeat,
+            "workers" : ResourceManager.LOAD_WORKERS, "textures" : len(main.TEXTURES), "audioClips" : len(main.AUDIO_CLIPS),
+            "launches" : results}
+
+def BenchColliders(args):
+    results = []
+    for path in LevelPaths():
+        levelMap = LevelMap(64)
+        levelMap.LoadMap(path)
+        start = time.perf_counter()
+        levelMap.GenerateColliders()
+        elapsed = time.perf_counter() - start
+        results.append({"level" : os.path.basename(path), "wallTiles" : levelMap.colliderStats["wallTiles"],
+                        "stripColliders" : CountStripColliders(levelMap),
+                        "colliders" : levelMap.colliderStats["colliders"],
+                        "triggers" : len(levelMap.triggers), "generateMs" : elapsed * 1000.0})
+    return {"benchmark" : "colliders", "revision" : GetRevision(), "levels" : results}
+
+def Main(argv = None):
+    argv = sys.argv[1:] if argv == None else argv
+    if not argv or argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        argv = ["frames"] + argv
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--out", help="write the JSON report to this file instead of stdout")
+    parser = argparse.ArgumentParser(description="Wonderball benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    frames = subparsers.add_parser("frames", parents=[common],
+                                   help="headless uncapped frames through every level with scripted input")
+    frames.add_argument("--frames", type=int, default=600)
+    frames.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3, 4])
+    frames.add_argument("--dt", type=float, default=1/60, help="simulated seconds per frame")
+    frames.set_defaults(func=BenchFrames)
+    colliders = subparsers.add_parser("colliders", parents=[common],
+                                      help="wall collider counts of the strip merge versus the rectangle merge")
+    colliders.set_defaults(func=BenchColliders)
+    vector = subparsers.add_parser("vector", parents=[common], help="Vector2 allocations per frame and CircleAABB cost")
+    vector.add_argument("--frames", type=int, default=300)
+    vector.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3, 4])
+    vector.add_argument("--dt", type=float, default=1/60)
+    vector.set_defaults(func=BenchVector)
+    collide = subparsers.add_parser("collide", parents=[common], help="scalar versus numpy batched CircleAABB")
+    collide.add_argument("--centers", type=int, default=1000)
+    collide.add_argument("--radius", type=float, default=28)
+    collide.set_defaults(func=BenchCollide)
+    levels = subparsers.add_parser("levels", parents=[common], help="level load time, .dat parse versus compiled file")
+    levels.add_argument("--repeat", type=int, default=50, help="loads per level, the median is reported")
+    levels.set_defaults(func=BenchLevels)
+    marathon = subparsers.add_parser("marathon", parents=[common], help="whole load versus streaming of a very long level")
+    marathon.add_argument("--columns", type=int, default=10000)
+    marathon.add_argument("--step", type=int, default=64, help="camera sweep step in pixels")
+    marathon.set_defaults(func=BenchMarathon)
+    restart = subparsers.add_parser("restart", parents=[common], help="reloading a large level versus resetting it")
+    restart.add_argument("--columns", type=int, default=2000)
+    restart.add_argument("--repeat", type=int, default=10, help="runs of each, the median is reported")
+    restart.add_argument("--played", type=float, nargs="+", default=[0.0, 0.1, 1.0],
+                         help="fractions of the rings / boosts / checkpoints used up before the reset")
+    restart.set_defaults(func=BenchRestart)
+    startup = subparsers.add_parser("startup", parents=[common], help="asset loading without, with a cold and a warm asset cache")
+    startup.add_argument("--repeat", type=int, default=10, help="launches of each, the median is reported")
+    startup.set_defaults(func=BenchStartup)
+    ccd = subparsers.add_parser("ccd", parents=[common], help="tunneling and cost of continuous collision per sim rate")
+    ccd.add_argument("--rates", type=int, nargs="+", default=[120, 60, 30, 20, 15])
+    ccd.add_argument("--frames", type=int, default=900)
+    ccd.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3, 4])
+    ccd.add_argument("--dt", type=float, default=1/60)
+    ccd.set_defaults(func=BenchCCD)
+    entities = subparsers.add_parser("entities", parents=[common], help="entity physics cost from 1 to 1000 bodies")
+    entities.add_argument("--counts", type=int, nargs="+", default=[1, 10, 100, 1000])
+    entities.add_argument("--steps", type=int, default=600)
+    entities.add_argument("--dt", type=float, default=1/120)
+    entities.set_defaults(func=BenchEntities)
+    args = parser.parse_args(argv)
+
+    # Keep the game's log lines out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        report = args.func(args)
+        pygame.quit()
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    Main()
@@ -1,61 +1,84 @@
+import os
+import sys
 import pygame
+from Engine.AssetCache import AssetCache
+from Engine.LevelMap import LevelMap
+from Engine.MusicChannel import MusicTrack
 from Engine.StateManager import StateManager
 from Engine.ResourceManager import ResourceManager
-from Engine.Resources import Texture2D, Audio
 from State_Level import State_Level
 from State_MainMenu import State_MainMenu
 from State_GameOver import State_GameOver
+from State_Loading import State_Loading
 
 # Global Constants
 FPS = 60
+IDLE_FPS = 10 # Tick rate while the current state has nothing new to draw
 WIN_DIMENSION = (960, 640) # Grid = 15 x 10, 64px
 
 # Game Global
-WIN = pygame.display.set_mode(WIN_DIMENSION)
-
-# Setup window
-pygame.display.set_caption("Wonderball")
+WIN : pygame.Surface = None
+
+# name, path
+TEXTURES = [
+    ("Ball", os.path.join("Assets", "Ball.png")),
+    ("Brick", os.path.join("Assets", "Dirt.png")),
+    ("Black", os.path.join("Assets", "Black.png")),
+    ("Checkpoint_Active", os.path.join("Assets", "Checkpoint_Active.png")),
+    ("Checkpoint_NotActive", os.path.join("Assets", "Checkpoint_NotActive.png")),
+    ("Startpoint", os.path.join("Assets", "Startpoint.png")),
+    ("Endpoint", os.path.join("Assets", "elil.png")),
+    ("NotEnd", os.path.join("Assets", "Endpoint.png")),
+    ("Ring", os.path.join("Assets", "ring.png")),
+    ("Slope", os.path.join("Assets", "Slope.png")),
+    ("Spike", os.path.join("Assets", "Spike.png")),
+    ("JumpPad", os.path.join("Assets", "JumpPad.png")),
+    ("Title", os.path.join("Assets", "Wonderball.png")),
+    ("JumpBoost", os.path.join("Assets", "JumpBoost.png")),
+    ("SpeedBoost", os.path.join("Assets", "SpeedBoost.png")),
+]
+# name, path, volume
+AUDIO_CLIPS = [
+    ("Selecting", os.path.join("Assets", "SFX", "blipSelect.wav"), 0.4),
+    ("Checkpoint", os.path.join("Assets", "SFX", "checkpoint.wav"), 0.4),
+    ("Hit", os.path.join("Assets", "SFX", "hitHurt.wav"), 0.8),
+    ("Jump", os.path.join("Assets", "SFX", "jump.wav"), 1.2),
+    ("PickupCoin", os.path.join("Assets", "SFX", "pickupCoin.wav"), 0.2),
+    ("JumpPad", os.path.join("Assets", "SFX", "jumpPad.wav"), 0.7),
+    ("Boost", os.path.join("Assets", "SFX", "Boost.wav"), 1.0),
+]
+# name, path, volume. Streamed from disk while playing
+MUSIC_TRACKS = [
+    ("MainMenuBGM", os.path.join("Assets", "SFX", "mainMenuBGM.wav"), 0.3),
+    ("inGameBGM", os.path.join("Assets", "SFX", "inGameBGM.wav"), 1.0),
+]
+CACHE_DIR = "Cache" # Generated files, safe to delete
 
 # Global Var
 rm = ResourceManager()
 sm = StateManager(rm, WIN)
 
-def InitializeResources():
-    rm.AddTexture(Texture2D("Ball", "Assets\\Ball.png"))
-    rm.AddTexture(Texture2D("Brick", "Assets\\Dirt.png"))
-    rm.AddTexture(Texture2D("Black", "Assets\\Black.png"))
-    rm.GetTexture("Black").tex.set_alpha(128)
-    rm.AddTexture(Texture2D("Checkpoint_Active", "Assets\\Checkpoint_Active.png"))
-    rm.AddTexture(Texture2D("Checkpoint_NotActive", "Assets\\Checkpoint_NotActive.png"))
-    rm.AddTexture(Texture2D("Startpoint", "Assets\\Startpoint.png"))
-    rm.AddTexture(Texture2D("Endpoint", "Assets\\elil.png"))
-    rm.AddTexture(Texture2D("NotEnd", "Assets\\Endpoint.png"))
-    rm.AddTexture(Texture2D("Ring", "Assets\\Ring.png"))
-    rm.AddTexture(Texture2D("Slope", "Assets\\Slope.png"))
-    rm.AddTexture(Texture2D("Spike", "Assets\\Spike.png"))
-    rm.AddTexture(Texture2D("JumpPad", "Assets\\JumpPad.png"))
-    rm.AddTexture(Texture2D("Title", "Assets\\Wonderball.png"))
-    rm.AddTexture(Texture2D("JumpBoost", "Assets\\JumpBoost.png"))
-    rm.AddTexture(Texture2D("SpeedBoost", "Assets\\SpeedBoost.png"))
+def CreateWindow(headless = False):
+    global WIN
+    if headless:
+        # No display or sound card needed, SDL renders to memory and discards audio
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+    pygame.init()
+    WIN = pygame.display.set_mode(WIN_DIMENSION)
+    # Setup window
+    pygame.display.set_caption("Wonderball")
+    sm.window = WIN
 
-    rm.AddAudioClip(Audio("Selecting", "Assets\\SFX\\blipSelect.wav"))
-    rm.GetAudioClip("Selecting").source.set_volume(0.4)
-    rm.AddAudioClip(Audio("Checkpoint", "Assets\\SFX\\checkpoint.wav"))
-    rm.GetAudioClip("Checkpoint").source.set_volume(0.4)
-    rm.AddAudioClip(Audio("Hit", "Assets\\SFX\\hitHurt.wav"))
-    rm.GetAudioClip("Hit").source.set_volume(0.8)
-    rm.AddAudioClip(Audio("Jump", "Assets\\SFX\\jump.wav"))
-    rm.GetAudioClip("Jump").source.set_volume(1.2)
-    rm.AddAudioClip(Audio("PickupCoin", "Assets\\SFX\\pickupCoin.wav"))
-    rm.GetAudioClip("PickupCoin").source.set_volume(0.2)
-    rm.AddAudioClip(Audio("JumpPad", "Assets\\SFX\\jumpPad.wav"))
-    rm.GetAudioClip("JumpPad").source.set_volume(0.7)
-    rm.AddAudioClip(Audio("MainMenuBGM", "Assets\\SFX\\mainMenuBGM.wav"))
-    rm.GetAudioClip("MainMenuBGM").source.set_volume(0.3)
-    rm.AddAudioClip(Audio("inGameBGM", "Assets\\SFX\\inGameBGM.wav"))
-    rm.GetAudioClip("inGameBGM").source.set_volume(1.0)
-    rm.AddAudioClip(Audio("Boost", "Assets\\SFX\\Boost.wav"))
-    rm.GetAudioClip("Boost").source.set_volume(1.0)
+def InitializeResources():
+    LevelMap.compiledDir = os.path.join(CACHE_DIR, "Levels")
+    rm.assetCache = AssetCache(os.path.join(CACHE_DIR, "Assets"))
+    # Decoded on loader threads while State_Loading is shown, anything used earlier is waited for
+    rm.LoadTextureAtlasAsync(TEXTURES, LevelMap.Tiles + ["Ball", "Black", "Title"], CACHE_DIR)
+    rm.SetTextureAlpha("Black", 128)
+    rm.LoadAudioClipsAsync(AUDIO_CLIPS)
+    for name, path, volume in MUSIC_TRACKS:
+        rm.music.AddTrack(MusicTrack(name, path, volume))
 
     rm.InitFont()
     #rm.PrettyPrint()
@@ -64,19 +87,12 @@ def InitializeStates():
     sm.AddState(State_Level)
     sm.AddState(State_MainMenu)
     sm.AddState(State_GameOver)
-    sm.ChangeState(State_MainMenu.statename)
-
-def GetDeltaTime(getTicksLastFrame = [0]):
-    t = pygame.time.get_ticks()
-    # deltaTime in seconds.
-    deltaTime = (t - getTicksLastFrame[0]) / 1000.0
-    getTicksLastFrame[0] = t
-    return deltaTime
-    #Debug.Log(deltaTime)
+    sm.AddState(State_Loading)
+    sm.ChangeState(State_Loading.statename)
 
 # Game Loop
-def main():
-    pygame.init()
+def main(headless = False):
+    CreateWindow(headless)
     InitializeResources()
     InitializeStates()
     clock = pygame.time.Clock()
@@ -85,7 +101,11 @@ def main():
         if sm.IsStateChanged():
             sm.LoadNewState()
 
-        clock.tick(FPS)
+        # deltaTime in seconds, measured by the same clock that caps the frame rate
+        if headless:
+            deltaTime = clock.tick() / 1000.0 # Uncapped
+        else:
+            deltaTime = clock.tick(IDLE_FPS if sm.IsCurrentStateIdle() else FPS) / 1000.0
 
         # Events
         eventList = pygame.event.get()
@@ -94,7 +114,8 @@ def main():
                 run = False
 
         # State Update
-        sm.UpdateState(eventList, GetDeltaTime())
+        sm.UpdateState(eventList, deltaTime)
+        rm.music.Update()
 
         if sm.IsStateChanged():
             if sm.isQuit():
@@ -103,7 +124,8 @@ def main():
                 sm.UnloadCurrentState()
 
     sm.CleanUp()
+    rm.Shutdown()
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main("--headless" in sys.argv)
\ No newline at end of file